@@ -1,11 +1,13 @@
 import sys, json, traceback, inspect
 import http.server
+from urllib.parse import parse_qs
 from types import ModuleType
 from importlib import reload
 
 class RPCServerHandler(http.server.SimpleHTTPRequestHandler):
   functions = {}
   redirects = {}
+  streams = {}
   modules = []
 
   def do_GET(self):
@@ -19,6 +21,12 @@ class RPCServerHandler(http.server.SimpleHTTPRequestHandler):
       self.send_header('location', path_to)
       self.end_headers()
       return True
+    elif path.startswith('stream/') and path[len('stream/'):] in self.streams:
+      # server-sent events: every value of the stream is sent as JSON
+      query = self.path.split('?', 1)[1] if '?' in self.path else ''
+      params = {k: v[0] for k, v in parse_qs(query).items()}
+      self.send_stream(self.streams[path[len('stream/'):]], params)
+      return True
     else:
       # serve the file!
       self.path = path
@@ -52,10 +60,30 @@ class RPCServerHandler(http.server.SimpleHTTPRequestHandler):
       self.send_error(404, 'function not found: ' + path + " , while registered functions are: " + str(self.functions))
     return
 
+  def send_stream(self, function, params):
+    self.send_response(200)
+    self.send_header('Content-Type', 'text/event-stream')
+    self.send_header('Cache-Control', 'no-cache')
+    self.end_headers()
+    try:
+      for event in function(params):
+        self.wfile.write(bytes("data: " + json.dumps(event) + "\n\n", 'utf-8'))
+        self.wfile.flush()
+    except (BrokenPipeError, ConnectionResetError):
+      # client closed the stream
+      pass
+    except:
+      traceback.print_exc();
+      print("STREAM CRASHED! See above:")
+
   @classmethod
   def register_function(cls, function, name):
     cls.functions[name] = function
 
+  @classmethod
+  def register_stream(cls, function, name):
+    cls.streams[name] = function
+
   @classmethod
   def register_redirect(cls, path_from, path_to):
     cls.redirects[path_from] = path_to
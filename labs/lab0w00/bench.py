@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the gas engines
+
+Runs every engine on the gases in resources/gasses and on synthetic gases
+and reports steps per second, cells per second and peak memory.  Times
+include conversion from and to the gas dict.  Peak
+memory is measured with tracemalloc in this process, so it does not
+include memory of tiled worker processes.
+
+Usage: bench.py [--steps N] [--sizes N ...] [--engines NAME ...] [--output FILE]
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tracemalloc
+
+import lab
+import tiled
+
+GASSES_DIRECTORY = os.path.join(os.path.dirname(__file__), "resources", "gasses")
+
+
+def run_steps(gas, n_steps):
+    """Compute n_steps steps with lab.step"""
+    for _ in range(n_steps):
+        gas = lab.step(gas)
+    return gas
+
+
+def run_planes(gas, n_steps):
+    """Compute n_steps steps with lab.step_planes"""
+    for _ in range(n_steps):
+        gas = lab.step_planes(gas)
+    return gas
+
+
+def run_advance(gas, n_steps):
+    """
+    Compute n_steps steps as lab.run, but without skipping periods
+
+    lab.run skips whole periods of periodic gases, which would measure
+    the period detection instead of the steps.
+    """
+    width, height = gas["width"], gas["height"]
+    planes = lab.advance(lab.gas_to_planes(gas), width, height,
+                         lab.get_masks(width, height), n_steps,
+                         detect_cycles=False)
+    return lab.planes_to_gas(planes, width, height)
+
+
+# name: function(gas, n_steps) returning the gas after n_steps steps
+ENGINES = {"step": run_steps,
+           "step_planes": run_planes,
+           "run": run_advance,
+           "tiled": tiled.run}
+
+
+def synthetic_gas(size, density=0.1, seed=0):
+    """
+    Create a size x size gas in a wall box, randomly filled with particles
+
+    Parameters
+    ----------
+    size : int
+        Width and height of the gas
+    density : float
+        Probability of every direction in every cell inside the box
+    seed : int
+        Seed of the random generator
+
+    Returns
+    -------
+    dict
+        State of the gas
+    """
+    rng = random.Random(seed)
+    state = []
+    for y in range(size):
+        for x in range(size):
+            if x in (0, size - 1) or y in (0, size - 1):
+                state.append(["w"])
+            else:
+                state.append([item for item in "udlr"
+                              if rng.random() < density])
+    return {"width": size, "height": size, "state": state}
+
+
+def load_gasses():
+    """Return list of (name, gas) for the gases in resources/gasses"""
+    gasses = []
+    for name in sorted(os.listdir(GASSES_DIRECTORY)):
+        with open(os.path.join(GASSES_DIRECTORY, name), "r") as f:
+            gasses.append((name, json.load(f)))
+    return gasses
+
+
+def benchmark(name, gas, engine, n_steps):
+    """
+    Measure one engine on one gas
+
+    Parameters
+    ----------
+    name : str
+        Name of the gas in the report
+    gas : dict
+        Initial state of the gas
+    engine : str
+        Key of ENGINES
+    n_steps : int
+        Number of steps
+
+    Returns
+    -------
+    dict
+        Report of the run
+    """
+    # lab.step changes cells of its input
+    gas = json.loads(json.dumps(gas))
+    cells = gas["width"] * gas["height"]
+    start = time.perf_counter()
+    ENGINES[engine](json.loads(json.dumps(gas)), n_steps)
+    seconds = time.perf_counter() - start
+    # tracemalloc slows allocations down, so memory is measured separately
+    tracemalloc.start()
+    ENGINES[engine](gas, n_steps)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    seconds = max(seconds, 1e-9)
+    return {"gas": name,
+            "engine": engine,
+            "width": gas["width"],
+            "height": gas["height"],
+            "steps": n_steps,
+            "seconds": seconds,
+            "steps_per_sec": n_steps / seconds,
+            "cells_per_sec": n_steps * cells / seconds,
+            "peak_bytes": peak}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark of the gas engines")
+    parser.add_argument("--steps", type=int, default=20,
+                        help="number of steps of every run")
+    parser.add_argument("--sizes", type=int, nargs="*", default=[128, 256, 512],
+                        help="sizes of synthetic gases")
+    parser.add_argument("--engines", nargs="*", default=list(ENGINES),
+                        choices=list(ENGINES), help="engines to measure")
+    parser.add_argument("--output", default="bench.json",
+                        help="file for the JSON report")
+    args = parser.parse_args(argv)
+
+    gasses = load_gasses()
+    gasses += [("synthetic_%d" % size, synthetic_gas(size))
+               for size in args.sizes]
+    results = []
+    for name, gas in gasses:
+        for engine in args.engines:
+            result = benchmark(name, gas, engine, args.steps)
+            results.append(result)
+            print("%-22s %-12s %12.1f steps/s %14.0f cells/s %10d B" %
+                  (name, engine, result["steps_per_sec"],
+                   result["cells_per_sec"], result["peak_bytes"]),
+                  flush=True)
+    report = {"python": platform.python_version(),
+              "platform": platform.platform(),
+              "cpus": os.cpu_count(),
+              "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "results": results}
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,153 @@
+"""
+Binary gas file format
+
+A binary gas file is a header followed by one byte per cell, the bit mask
+of the items the cell holds (see lab.BITS), in the order of the "state"
+list:
+
+    magic   4 bytes  b"GAS1"
+    width   4 bytes  unsigned, little endian
+    height  4 bytes  unsigned, little endian
+    cells   width * height bytes
+
+Files are memory-mapped on load, so cells are never read into Python
+lists unless the gas dict is requested.
+
+Usage: gasfile.py INPUT.gas OUTPUT.bgas  converts a JSON gas to binary.
+"""
+
+import sys
+import json
+import mmap
+import struct
+
+import lab
+
+MAGIC = b"GAS1"
+HEADER = struct.Struct("<4sII")
+
+
+def is_binary(path):
+    """Check whether the file at path is a binary gas file"""
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def dump(gas, f):
+    """
+    Write the gas to a binary file object
+
+    Parameters
+    ----------
+    gas : dict
+        State of the gas
+    f : file
+        File object opened in binary mode
+    """
+    f.write(HEADER.pack(MAGIC, gas["width"], gas["height"]))
+    f.write(lab.gas_to_cells(gas))
+
+
+def save(path, gas):
+    """Write the gas to a binary file at path"""
+    with open(path, "wb") as f:
+        dump(gas, f)
+
+
+def _map(f):
+    """Memory-map a binary gas file, return (width, height, mapping)"""
+    mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if len(mapping) < HEADER.size:
+        mapping.close()
+        raise ValueError("Not a binary gas file")
+    magic, width, height = HEADER.unpack_from(mapping)
+    if magic != MAGIC or len(mapping) != HEADER.size + width * height:
+        mapping.close()
+        raise ValueError("Not a binary gas file")
+    return width, height, mapping
+
+
+def load_planes(path):
+    """
+    Load a binary gas file as bit-planes
+
+    Parameters
+    ----------
+    path : str
+        Path of the file
+
+    Returns
+    -------
+    tuple
+        (width, height, bit-planes in the order of lab.ITEMS)
+    """
+    with open(path, "rb") as f:
+        width, height, mapping = _map(f)
+        with mapping:
+            planes = lab.cells_to_planes(mapping[HEADER.size:])
+    return width, height, planes
+
+
+def load(path):
+    """
+    Load a binary gas file
+
+    Parameters
+    ----------
+    path : str
+        Path of the file
+
+    Returns
+    -------
+    dict
+        State of the gas
+    """
+    with open(path, "rb") as f:
+        width, height, mapping = _map(f)
+        with mapping:
+            return lab.cells_to_gas(mapping[HEADER.size:], width, height)
+
+
+def iter_rows(path):
+    """
+    Generate rows of a binary gas file, reading one row at a time
+
+    Parameters
+    ----------
+    path : str
+        Path of the file
+
+    Yields
+    ------
+    list
+        Cells of the next row, from top to bottom
+    """
+    with open(path, "rb") as f:
+        width, height, mapping = _map(f)
+        with mapping:
+            for y in range(height):
+                start = HEADER.size + y * width
+                yield lab.cells_to_gas(mapping[start:start + width],
+                                       width, 1)["state"]
+
+
+def load_any(path):
+    """Load a gas from a binary or JSON gas file"""
+    if is_binary(path):
+        return load(path)
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def convert(json_path, binary_path):
+    """Convert a JSON gas file to a binary gas file"""
+    with open(json_path, "r") as f:
+        gas = json.load(f)
+    save(binary_path, gas)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: gasfile.py INPUT.gas OUTPUT.bgas")
+        sys.exit(1)
+    convert(sys.argv[1], sys.argv[2])
@@ -125,3 +125,567 @@ def get_index(index, item, gas):
         raise ValueError("Unknown cell state")
     # valid inexes in range from 0 to gas["width"] * gas["height"]
     return new_index
+
+
+# Bit-plane representation of a gas:
+#
+# every item ("u", "d", "l", "r", "w") has its own plane, an int whose
+# bit i is set if cell i of the state holds that item.  Collisions and
+# propagation are computed for all cells at once with shifts and masks.
+ITEMS = ("u", "d", "l", "r", "w")
+
+
+def get_masks(width, height):
+    """
+    Compute masks needed to propagate bit-planes
+
+    Parameters
+    ----------
+    width : int
+        Width of the gas
+    height : int
+        Height of the gas
+
+    Returns
+    -------
+    tuple
+        (full, left, right): all cells, cells of the left column and cells
+        of the right column
+    """
+    size = width * height
+    if size == 0:
+        return 0, 0, 0
+    full = (1 << size) - 1
+    # the most significant char of a row string is the rightmost cell
+    left = int(("0" * (width - 1) + "1") * height, 2)
+    right = int(("1" + "0" * (width - 1)) * height, 2)
+    return full, left, right
+
+
+def gas_to_planes(gas):
+    """
+    Convert the gas to bit-planes
+
+    Parameters
+    ----------
+    gas : dict
+        State of the gas
+
+    Returns
+    -------
+    tuple
+        Bit-planes in the order of ITEMS
+    """
+    size = gas["width"] * gas["height"]
+    if size == 0:
+        return (0,) * len(ITEMS)
+    # one binary string per item, the last char is cell 0
+    bits = {item: bytearray(b"0" * size) for item in ITEMS}
+    for i, cell in enumerate(gas["state"]):
+        for item in cell:
+            if item not in bits:
+                raise ValueError("Unknown cell state")
+            bits[item][size - 1 - i] = ord("1")
+    return tuple(int(bits[item], 2) for item in ITEMS)
+
+
+def planes_to_gas(planes, width, height):
+    """
+    Convert bit-planes to the gas
+
+    Parameters
+    ----------
+    planes : tuple
+        Bit-planes in the order of ITEMS
+    width : int
+        Width of the gas
+    height : int
+        Height of the gas
+
+    Returns
+    -------
+    dict
+        State of the gas
+    """
+    size = width * height
+    state = [[] for _ in range(size)]
+    for item, plane in zip(ITEMS, planes):
+        # reversed binary string, so char i is cell i
+        bits = bin(plane)[:1:-1]
+        i = bits.find("1")
+        while i != -1:
+            state[i].append(item)
+            i = bits.find("1", i + 1)
+    return {"width": width,
+            "height": height,
+            "state": state}
+
+
+def collide_planes(planes):
+    """
+    Compute collisions at the bit-planes of the gas
+
+    Parameters
+    ----------
+    planes : tuple
+        Bit-planes before collisions
+
+    Returns
+    -------
+    tuple
+        Bit-planes after collisions
+    """
+    u, d, l, r, w = planes
+    # particles at walls are reversed, pair collisions are only possible
+    # in cells without wall which hold exactly two opposite particles
+    free = ~w
+    lr = l & r & ~(u | d) & free
+    ud = u & d & ~(l | r) & free
+    return ((d & w) | (u & free & ~ud) | lr,
+            (u & w) | (d & free & ~ud) | lr,
+            (r & w) | (l & free & ~lr) | ud,
+            (l & w) | (r & free & ~lr) | ud,
+            w)
+
+
+def propagate_planes(planes, width, masks):
+    """
+    Compute propagation at the bit-planes of the gas
+
+    Parameters
+    ----------
+    planes : tuple
+        Bit-planes before propagation
+    width : int
+        Width of the gas
+    masks : tuple
+        Masks returned by get_masks
+
+    Returns
+    -------
+    tuple
+        Bit-planes after propagation
+    """
+    u, d, l, r, w = planes
+    full, left, right = masks
+    # particles leaving the gas are lost
+    return (u >> width,
+            (d << width) & full,
+            (l & ~left) >> 1,
+            (r & ~right) << 1,
+            w)
+
+
+def step_planes(gas):
+    """
+    Compute next state of the gas using bit-planes
+
+    Gives the same result as step, but does not change the given gas
+
+    Parameters
+    ----------
+    gas : dict
+        Initial state of the gas
+
+    Returns
+    -------
+    dict
+        Next state of the gas.
+    """
+    width, height = gas["width"], gas["height"]
+    planes = gas_to_planes(gas)
+    planes = propagate_planes(collide_planes(planes), width,
+                              get_masks(width, height))
+    return planes_to_gas(planes, width, height)
+
+
+def advance_planes(planes, width, masks, n_steps):
+    """
+    Compute n_steps steps at the bit-planes of the gas
+
+    Parameters
+    ----------
+    planes : tuple
+        Initial bit-planes
+    width : int
+        Width of the gas
+    masks : tuple
+        Masks returned by get_masks
+    n_steps : int
+        Number of steps
+
+    Returns
+    -------
+    tuple
+        Bit-planes after n_steps steps
+    """
+    for _ in range(n_steps):
+        planes = propagate_planes(collide_planes(planes), width, masks)
+    return planes
+
+
+def run(gas, n_steps, every=None):
+    """
+    Compute state of the gas after n_steps steps
+
+    The gas is kept as bit-planes, or as sets of occupied cells while it
+    is mostly empty, between steps, the state dict is built only for the
+    result. Periodic gases are not computed beyond their first repeated
+    state. The given gas is not changed.
+
+    Parameters
+    ----------
+    gas : dict
+        Initial state of the gas
+    n_steps : int
+        Number of steps
+    every : int, optional
+        If given, return a generator of the states after every `every`
+        steps (and after the last step) instead of the last state
+
+    Returns
+    -------
+    dict or generator
+        State of the gas after n_steps steps, or generator of snapshots
+    """
+    if every is not None:
+        return run_snapshots(gas, n_steps, every)
+    width, height = gas["width"], gas["height"]
+    planes = advance(gas_to_planes(gas), width, height,
+                     get_masks(width, height), n_steps)
+    return planes_to_gas(planes, width, height)
+
+
+def run_snapshots(gas, n_steps, every):
+    """
+    Generate states of the gas after every `every` steps
+
+    Parameters
+    ----------
+    gas : dict
+        Initial state of the gas
+    n_steps : int
+        Number of steps
+    every : int
+        Number of steps between snapshots
+
+    Yields
+    ------
+    dict
+        State of the gas after every, 2 * every, ... steps and after the
+        last step
+    """
+    if every < 1:
+        raise ValueError("every must be positive")
+    width, height = gas["width"], gas["height"]
+    masks = get_masks(width, height)
+    planes = gas_to_planes(gas)
+    done = 0
+    while done < n_steps:
+        chunk = min(every, n_steps - done)
+        planes = advance(planes, width, height, masks, chunk)
+        done += chunk
+        yield planes_to_gas(planes, width, height)
+
+
+# Sparse representation of a gas:
+#
+# every item has a set of indexes of the cells holding it, so a step
+# touches only occupied cells.  It is used by run for mostly empty gases.
+# The sparse form is used while particles * SPARSE_RATIO < cells, the
+# dense one while particles * SPARSE_RATIO > 2 * cells (the gap avoids
+# switching back and forth), occupancy is checked every SWITCH_PERIOD steps
+SPARSE_RATIO = 256
+SWITCH_PERIOD = 16
+
+
+def planes_to_sparse(planes):
+    """
+    Convert bit-planes to sets of occupied cells
+
+    Parameters
+    ----------
+    planes : tuple
+        Bit-planes in the order of ITEMS
+
+    Returns
+    -------
+    tuple
+        Sets of cell indexes in the order of ITEMS
+    """
+    sparse = []
+    for plane in planes:
+        cells = set()
+        bits = bin(plane)[:1:-1]
+        i = bits.find("1")
+        while i != -1:
+            cells.add(i)
+            i = bits.find("1", i + 1)
+        sparse.append(cells)
+    return tuple(sparse)
+
+
+def sparse_to_planes(sparse, size):
+    """
+    Convert sets of occupied cells to bit-planes
+
+    Parameters
+    ----------
+    sparse : tuple
+        Sets of cell indexes in the order of ITEMS
+    size : int
+        Number of cells in the gas
+
+    Returns
+    -------
+    tuple
+        Bit-planes in the order of ITEMS
+    """
+    planes = []
+    for cells in sparse:
+        if not cells:
+            planes.append(0)
+            continue
+        bits = bytearray(b"0" * size)
+        for i in cells:
+            bits[size - 1 - i] = ord("1")
+        planes.append(int(bits, 2))
+    return tuple(planes)
+
+
+def collide_sparse(sparse):
+    """
+    Compute collisions at the sets of occupied cells
+
+    Parameters
+    ----------
+    sparse : tuple
+        Sets of cell indexes before collisions
+
+    Returns
+    -------
+    tuple
+        Sets of cell indexes after collisions
+    """
+    u, d, l, r, w = sparse
+    # same rules as in collide_planes
+    lr = (l & r) - u - d - w
+    ud = (u & d) - l - r - w
+    return ((d & w) | (u - w - ud) | lr,
+            (u & w) | (d - w - ud) | lr,
+            (r & w) | (l - w - lr) | ud,
+            (l & w) | (r - w - lr) | ud,
+            w)
+
+
+def propagate_sparse(sparse, width, height):
+    """
+    Compute propagation at the sets of occupied cells
+
+    Parameters
+    ----------
+    sparse : tuple
+        Sets of cell indexes before propagation
+    width : int
+        Width of the gas
+    height : int
+        Height of the gas
+
+    Returns
+    -------
+    tuple
+        Sets of cell indexes after propagation
+    """
+    u, d, l, r, w = sparse
+    last_row = width * (height - 1)
+    # particles leaving the gas are lost
+    return ({i - width for i in u if i >= width},
+            {i + width for i in d if i < last_row},
+            {i - 1 for i in l if i % width != 0},
+            {i + 1 for i in r if i % width != width - 1},
+            w)
+
+
+def count_particles(planes):
+    """Return number of particles in the bit-planes"""
+    return sum(bin(plane).count("1") for plane in planes[:4])
+
+
+def advance(planes, width, height, masks, n_steps, detect_cycles=True):
+    """
+    Compute n_steps steps of the gas given as bit-planes
+
+    Switches to sets of occupied cells while the gas is mostly empty.
+    Once the gas repeats an earlier state, whole periods are skipped
+    unless detect_cycles is false.
+
+    Parameters
+    ----------
+    planes : tuple
+        Initial bit-planes
+    width : int
+        Width of the gas
+    height : int
+        Height of the gas
+    masks : tuple
+        Masks returned by get_masks
+    n_steps : int
+        Number of steps
+    detect_cycles : bool, optional
+        Skip whole periods of periodic gases, True by default
+
+    Returns
+    -------
+    tuple
+        Bit-planes after n_steps steps
+    """
+    size = width * height
+    sparse = None
+    # Brent's cycle detection: every state is compared with the state
+    # saved at saved_step, which is saved again after power steps and
+    # power doubles, so a cycle is found in at most about 3 periods
+    # after the gas enters it
+    detect = detect_cycles
+    saved, saved_step, power = None, 0, 1
+    done = 0
+    while done < n_steps:
+        if done % SWITCH_PERIOD == 0:
+            # choose representation by occupancy
+            if sparse is None:
+                if count_particles(planes) * SPARSE_RATIO < size:
+                    sparse = planes_to_sparse(planes)
+                    saved, saved_step, power = None, done, 1
+            elif sum(map(len, sparse[:4])) * SPARSE_RATIO > 2 * size:
+                planes = sparse_to_planes(sparse, size)
+                sparse = None
+                saved, saved_step, power = None, done, 1
+        if sparse is None:
+            planes = propagate_planes(collide_planes(planes), width, masks)
+            state = planes
+        else:
+            sparse = propagate_sparse(collide_sparse(sparse), width, height)
+            state = sparse
+        done += 1
+        if not detect:
+            continue
+        if state == saved:
+            # the gas repeats every period steps
+            period = done - saved_step
+            done += (n_steps - done) // period * period
+            detect = False
+        elif done - saved_step == power:
+            saved, saved_step, power = state, done, power * 2
+    if sparse is not None:
+        planes = sparse_to_planes(sparse, size)
+    return planes
+
+
+# Byte representation of a gas:
+#
+# one byte per cell, the bit mask of the items the cell holds
+BITS = {"u": 1, "d": 2, "l": 4, "r": 8, "w": 16}
+# translate byte mask to "1" if the item bit is set, else to "0"
+_ITEM_TABLES = tuple(bytes(ord("1") if v & BITS[item] else ord("0")
+                           for v in range(256))
+                     for item in ITEMS)
+# translate "0" and "1" to 0 and 1
+_DIGIT_TABLE = bytes.maketrans(b"01", b"\x00\x01")
+
+
+def gas_to_cells(gas):
+    """
+    Convert the gas to byte masks of its cells
+
+    Parameters
+    ----------
+    gas : dict
+        State of the gas
+
+    Returns
+    -------
+    bytearray
+        Bit mask of items for every cell
+    """
+    cells = bytearray(gas["width"] * gas["height"])
+    for i, cell in enumerate(gas["state"]):
+        mask = 0
+        for item in cell:
+            if item not in BITS:
+                raise ValueError("Unknown cell state")
+            mask |= BITS[item]
+        cells[i] = mask
+    return cells
+
+
+def cells_to_gas(cells, width, height):
+    """
+    Convert byte masks of cells to the gas
+
+    Parameters
+    ----------
+    cells : bytes-like
+        Bit mask of items for every cell
+    width : int
+        Width of the gas
+    height : int
+        Height of the gas
+
+    Returns
+    -------
+    dict
+        State of the gas
+    """
+    # items of every possible mask
+    items = [[item for item in ITEMS if mask & BITS[item]]
+             for mask in range(256)]
+    return {"width": width,
+            "height": height,
+            "state": [items[mask][:] for mask in cells]}
+
+
+def cells_to_planes(cells):
+    """
+    Convert byte masks of cells to bit-planes
+
+    Parameters
+    ----------
+    cells : bytes-like
+        Bit mask of items for every cell
+
+    Returns
+    -------
+    tuple
+        Bit-planes in the order of ITEMS
+    """
+    if len(cells) == 0:
+        return (0,) * len(ITEMS)
+    cells = bytes(cells)
+    return tuple(int(cells.translate(table)[::-1], 2)
+                 for table in _ITEM_TABLES)
+
+
+def planes_to_cells(planes, size):
+    """
+    Convert bit-planes to byte masks of cells
+
+    Parameters
+    ----------
+    planes : tuple
+        Bit-planes in the order of ITEMS
+    size : int
+        Number of cells in the gas
+
+    Returns
+    -------
+    bytes
+        Bit mask of items for every cell
+    """
+    if size == 0:
+        return b""
+    result = 0
+    for item, plane in zip(ITEMS, planes):
+        # spread bits of the plane to one byte per cell
+        digits = format(plane, "0%db" % size)[::-1].encode()
+        result |= int.from_bytes(digits.translate(_DIGIT_TABLE),
+                                 "little") * BITS[item]
+    return result.to_bytes(size, "little")
@@ -1,43 +1,51 @@
-#!/usr/bin/env python2.7
+#!/usr/bin/env python3
 
-import json, sys, re, string, random
+import os, json, sys, re, random
+
+# gasfile lives in the lab directory
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import gasfile
 
 def print_usage():
-  print "WIDTH HEIGHT [features]*"
-  print "Features (one or more may be added):"
-  print "Rx[0-9]+y[0-9]+w[0-9]+h[0-9]+a[UDLRW]+ : set hollow rectangle"
-  print "Fx[0-9]+y[0-9]+w[0-9]+h[0-9]+a[UDLRW]+ : set filled rectangle"
-  print "Ex[0-9]+y[0-9]+w[0-9]+h[0-9]+a[0-100] : set random-filled rectangle with density 0-100 %"
-  print "For example, \"./create_gas.py 16 16 Fx6y6w4h4aULRD Rx0y0w16h16aW > ./cases/ripple_small.gas\" is exactly what we used to generate the ripple_small test"
-  print "Likewise, \"./create_gas.py 64 64 Ex1y1w62h62a10 Fx24y24w8h8aULRD Rx0y0w64h64aW\" generates a large ripple in a randomly filled gas of 10% density."
-  print "Have fun!"
+  print("[-b] WIDTH HEIGHT [features]*")
+  print("-b : write the gas in the binary format of gasfile.py instead of JSON")
+  print("Features (one or more may be added):")
+  print("Rx[0-9]+y[0-9]+w[0-9]+h[0-9]+a[UDLRW]+ : set hollow rectangle")
+  print("Fx[0-9]+y[0-9]+w[0-9]+h[0-9]+a[UDLRW]+ : set filled rectangle")
+  print("Ex[0-9]+y[0-9]+w[0-9]+h[0-9]+a[0-100] : set random-filled rectangle with density 0-100 %")
+  print("For example, \"./create_gas.py 16 16 Fx6y6w4h4aULRD Rx0y0w16h16aW > ./cases/ripple_small.gas\" is exactly what we used to generate the ripple_small test")
+  print("Likewise, \"./create_gas.py 64 64 Ex1y1w62h62a10 Fx24y24w8h8aULRD Rx0y0w64h64aW\" generates a large ripple in a randomly filled gas of 10% density.")
+  print("Have fun!")
 
 def main():
-  if len(sys.argv) < 3:
+  args = sys.argv[1:]
+  binary = len(args) > 0 and args[0] == "-b"
+  if binary:
+    args = args[1:]
+  if len(args) < 2:
     print_usage()
     return
 
-  width = string.atoi(sys.argv[1]);
-  height = string.atoi(sys.argv[2]);
-  state = [[] for _ in range(width*height)];
-
-  for feature in sys.argv[3:]:
-    #pdb.set_trace()
+  width = int(args[0])
+  height = int(args[1])
+  state = [[] for _ in range(width*height)]
 
+  for feature in args[2:]:
     match = re.match(r"([RFE])x([0-9]+)y([0-9]+)w([0-9]+)h([0-9]+)a([UDLRW]*[0-9]*)", feature)
     if not match:
-      print "Badly formatted feature! : " + feature
+      print("Badly formatted feature! : " + feature)
       print_usage()
+      return
 
     (f, x, y, w, h, s) = match.groups()
-    x = string.atoi(x)
-    y = string.atoi(y)
-    w = string.atoi(w)
-    h = string.atoi(h)
+    x = int(x)
+    y = int(y)
+    w = int(w)
+    h = int(h)
 
     chance = 100
     if (f == "E"):
-        chance = string.atoi(s)
+        chance = int(s)
 
     s = (["u"] if "U" in s else []) + \
         (["d"] if "D" in s else []) + \
@@ -61,10 +69,12 @@ def main():
 
         state[(x+i)+(y+j)*width]  = list(set(s))
 
-
-  print json.dumps({"width": width, "height": height, "state": state})
+  gas = {"width": width, "height": height, "state": state}
+  if binary:
+    gasfile.dump(gas, sys.stdout.buffer)
+  else:
+    print(json.dumps(gas))
 
 
 if __name__ == "__main__":
   main()
-
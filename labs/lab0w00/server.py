@@ -2,6 +2,7 @@
 from RPCServerHandler import RPCServerHandler
 import socketserver, os, atexit, json
 import wrapper
+import gasfile
 
 # Initialize all the things
 PORT = 8000
@@ -62,6 +63,13 @@ RPCServerHandler.register_function(lambda d : cat_file( d['path'] ), 'cat')
 # returns json object encoded by a file
 RPCServerHandler.register_function(lambda d : load_json_file( d['path'] ), 'load_json')
 
+# load_gas: read a gas from a JSON or binary gas file
+# returns gas dictionary { width: .., height: .., state: [..] }
+RPCServerHandler.register_function(lambda d : gasfile.load_any( d['path'] ), 'load_gas')
+
+# stream/frames: GET event stream of diffs of a gas session (see wrapper.py)
+RPCServerHandler.register_stream(lambda params : wrapper._frames( params ), 'frames')
+
 # call: call student code
 # returns return value
 RPCServerHandler.register_module("wrapper")
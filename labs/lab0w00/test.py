@@ -2,6 +2,13 @@
 
 import os
 import lab
+import copy
+import importlib
+import tiled
+import gasfile
+import tempfile
+import bench
+import wrapper
 import json
 import unittest
 
@@ -147,6 +154,179 @@ class TestGas(unittest.TestCase):
                   "height": 3}
         self.check_result(result, expect)
 
+    def test_planes_cases(self):
+        # step_planes() is equal to step() on every case
+        for n in range(1, 12):
+            with self.subTest(case=n):
+                _, input, expect = self.load_case(str(n))
+                result = lab.step_planes(input)
+                self.check_result(result, expect)
+
+    def test_planes_gasses(self):
+        # step_planes() is equal to step() on the resource gasses
+        for name in sorted(os.listdir("resources/gasses")):
+            with self.subTest(gas=name):
+                gas = self.load_gas(name)
+                expect = copy.deepcopy(gas)
+                for _ in range(20):
+                    gas = lab.step_planes(gas)
+                    expect = lab.step(expect)
+                    self.check_result(gas, expect)
+
+    def test_run(self):
+        # run() is equal to repeated step()
+        for name in ("gas_3.gas", "ripple_small.gas", "explosion_air.gas"):
+            with self.subTest(gas=name):
+                gas = self.load_gas(name)
+                result = lab.run(gas, 30)
+                expect = gas
+                for _ in range(30):
+                    expect = lab.step(copy.deepcopy(expect))
+                self.check_result(result, expect)
+                # input gas is not changed
+                self.check_result(gas, self.load_gas(name))
+
+    def test_run_every(self):
+        # run() with every yields snapshots and the last state
+        gas = self.load_gas("a_small.gas")
+        snapshots = list(lab.run(gas, 10, every=4))
+        self.assertEqual(len(snapshots), 3)
+        expect = gas
+        for n in range(1, 11):
+            expect = lab.step(copy.deepcopy(expect))
+            if n in (4, 8):
+                self.check_result(snapshots[n // 4 - 1], expect)
+        self.check_result(snapshots[-1], expect)
+
+    def test_sparse_gasses(self):
+        # sparse step is equal to step() on the resource gasses
+        for name in ("ripple_small.gas", "explosion_vacuum.gas", "large.gas"):
+            with self.subTest(gas=name):
+                gas = self.load_gas(name)
+                width, height = gas["width"], gas["height"]
+                sparse = lab.planes_to_sparse(lab.gas_to_planes(gas))
+                for _ in range(20):
+                    sparse = lab.propagate_sparse(lab.collide_sparse(sparse),
+                                                  width, height)
+                    gas = lab.step(gas)
+                    planes = lab.sparse_to_planes(sparse, width * height)
+                    self.check_result(lab.planes_to_gas(planes, width, height),
+                                      gas)
+
+    def test_run_sparse(self):
+        # run() on a mostly empty gas, which is computed in sparse form
+        width = height = 64
+        state = [[] for _ in range(width * height)]
+        for i in range(width):
+            for j in (i, i * width, width - 1 + i * width, i + width * (height - 1)):
+                state[j] = ["w"]
+        state[5 + 7 * width] = ["r"]
+        state[40 + 7 * width] = ["l"]
+        state[20 + 30 * width] = ["u", "d"]
+        gas = {"width": width, "height": height, "state": state}
+        result = lab.run(gas, 150)
+        expect = gas
+        for _ in range(150):
+            expect = lab.step(copy.deepcopy(expect))
+        self.check_result(result, expect)
+
+    def test_tiled(self):
+        # tiled.run() is equal to step() for any number of workers
+        for name in ("gas_3.gas", "explosion_air.gas", "colliding_fronts.gas"):
+            expect = self.load_gas(name)
+            for _ in range(10):
+                expect = lab.step(expect)
+            for workers in (1, 2, 4, 8):
+                with self.subTest(gas=name, workers=workers):
+                    result = tiled.run(self.load_gas(name), 10, workers)
+                    self.check_result(result, expect)
+
+    def test_gasfile(self):
+        # binary gas files hold the same gas as JSON files
+        with tempfile.TemporaryDirectory() as tmp:
+            for name in sorted(os.listdir("resources/gasses")):
+                with self.subTest(gas=name):
+                    path = os.path.join(tmp, name + ".bgas")
+                    gasfile.convert("resources/gasses/"+name, path)
+                    expect = self.load_gas(name)
+                    self.assertTrue(gasfile.is_binary(path))
+                    self.check_result(gasfile.load(path), expect)
+                    self.check_result(gasfile.load_any(path), expect)
+                    width, height, planes = gasfile.load_planes(path)
+                    self.assertEqual((width, height), (expect["width"], expect["height"]))
+                    self.assertEqual(planes, lab.gas_to_planes(expect))
+                    rows = [cell for row in gasfile.iter_rows(path) for cell in row]
+                    self.check_result({"width": width, "height": height, "state": rows}, expect)
+
+    def test_run_cycle(self):
+        # run() skips periods of periodic gases
+        for name in ("gas_3.gas", "ripple_small.gas", "large.gas", "a_small.gas"):
+            with self.subTest(gas=name):
+                gas = self.load_gas(name)
+                states = [lab.gas_to_planes(gas)]
+                for _ in range(300):
+                    states.append(lab.gas_to_planes(lab.step(lab.planes_to_gas(
+                        states[-1], gas["width"], gas["height"]))))
+                for n in (0, 1, 77, 300):
+                    self.check_result(lab.run(gas, n), lab.planes_to_gas(
+                        states[n], gas["width"], gas["height"]))
+        # gas_3 has period 14
+        gas = self.load_gas("gas_3.gas")
+        self.check_result(lab.run(gas, 14 * 10 ** 8 + 3), lab.run(gas, 3))
+        # without cycle detection every step is computed
+        planes = lab.gas_to_planes(gas)
+        masks = lab.get_masks(gas["width"], gas["height"])
+        self.assertEqual(lab.advance(planes, gas["width"], gas["height"], masks,
+                                     100, detect_cycles=False),
+                         lab.advance_planes(planes, gas["width"], masks, 100))
+        self.check_result(bench.run_advance(gas, 45), lab.run(gas, 45))
+
+    def test_bench(self):
+        # benchmark reports every engine
+        gas = bench.synthetic_gas(8)
+        self.assertEqual(len(gas["state"]), 64)
+        for engine in bench.ENGINES:
+            with self.subTest(engine=engine):
+                result = bench.benchmark("synthetic_8", gas, engine, 3)
+                self.assertEqual(result["steps"], 3)
+                self.assertGreater(result["cells_per_sec"], 0)
+                self.assertGreater(result["peak_bytes"], 0)
+
+    def test_session_diff(self):
+        # diffs of a server side gas give the same states as step()
+        gas = self.load_gas("ripple_small.gas")
+        session = wrapper.open_session({"gas": gas})["session"]
+        state = copy.deepcopy(gas["state"])
+        expect = gas
+        frames = wrapper._frames({"session": str(session), "steps": "2"})
+        for n in range(10):
+            if n < 5:
+                result = wrapper.diff({"session": session, "steps": 2})
+            else:
+                result = next(frames)
+                # two frames are sent before the first ack
+                if n > 5:
+                    self.assertTrue(wrapper.ack_frames({"session": session}))
+            for _ in range(2):
+                expect = lab.step(expect)
+            self.assertEqual(result["cycle"], 2 * (n + 1))
+            cells = result["cells"]
+            for i, mask in zip(cells[::2], cells[1::2]):
+                state[i] = [item for item in lab.ITEMS if mask & lab.BITS[item]]
+            self.check_result({"width": 16, "height": 16, "state": state}, expect)
+        wrapper.close_session({"session": session})
+        self.assertRaises(StopIteration, next, frames)
+        self.assertFalse(wrapper.ack_frames({"session": session}))
+        # sessions are kept when the page reloads the wrapper
+        session = wrapper.open_session({"gas": gas})["session"]
+        importlib.reload(wrapper)
+        self.assertEqual(wrapper.diff({"session": session})["cycle"], 1)
+        wrapper.close_session({"session": session})
+
+    def load_gas(self, name):
+        with open("resources/gasses/"+name, 'r') as f:
+            return json.loads(f.read())
+
     def load_case(self, case):
         # Read input
         with open("cases/"+case+'.in', 'r') as f:
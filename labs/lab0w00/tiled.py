@@ -0,0 +1,144 @@
+"""
+Multi-process simulation of the gas
+
+The gas is split into horizontal strips, one per worker process.  Cells
+are kept as byte masks in two shared memory buffers, every step a worker
+reads its strip of the current buffer together with one halo row of each
+neighbor and writes its strip of the next buffer.  Workers are
+synchronized by a barrier after every step.
+"""
+
+import os
+import multiprocessing
+from multiprocessing import shared_memory
+
+import lab
+
+
+def split_rows(height, workers):
+    """
+    Split rows of the gas into strips
+
+    Parameters
+    ----------
+    height : int
+        Height of the gas
+    workers : int
+        Number of strips
+
+    Returns
+    -------
+    list
+        (first row, row after the last) for every non empty strip
+    """
+    workers = max(1, min(workers, height))
+    bounds = [height * k // workers for k in range(workers + 1)]
+    return list(zip(bounds, bounds[1:]))
+
+
+def step_strip(src, width, height, top, bottom, masks):
+    """
+    Compute next state of a strip of the gas
+
+    Parameters
+    ----------
+    src : bytes-like
+        Byte masks of all cells of the gas
+    width : int
+        Width of the gas
+    height : int
+        Height of the gas
+    top : int
+        First row of the strip
+    bottom : int
+        Row after the last row of the strip
+    masks : tuple
+        Masks returned by lab.get_masks for the strip with halo rows
+
+    Returns
+    -------
+    bytes
+        Byte masks of cells of the strip
+    """
+    # halo rows, empty rows outside of the gas
+    empty = bytes(width)
+    upper = src[(top - 1) * width:top * width] if top > 0 else empty
+    lower = src[bottom * width:(bottom + 1) * width] \
+        if bottom < height else empty
+    strip = b"".join((upper, src[top * width:bottom * width], lower))
+    rows = bottom - top + 2
+    planes = lab.cells_to_planes(strip)
+    planes = lab.propagate_planes(lab.collide_planes(planes), width, masks)
+    # drop halo rows
+    return lab.planes_to_cells(planes, rows * width)[width:-width]
+
+
+def worker(names, width, height, top, bottom, n_steps, barrier):
+    """Compute n_steps steps of a strip in shared memory buffers"""
+    buffers = [shared_memory.SharedMemory(name=name) for name in names]
+    try:
+        masks = lab.get_masks(width, bottom - top + 2)
+        for n in range(n_steps):
+            src = buffers[n % 2].buf
+            dst = buffers[(n + 1) % 2].buf
+            dst[top * width:bottom * width] = \
+                step_strip(src, width, height, top, bottom, masks)
+            barrier.wait()
+    except BaseException:
+        # do not leave other workers waiting at the barrier
+        barrier.abort()
+        raise
+    finally:
+        for buffer in buffers:
+            buffer.close()
+
+
+def run(gas, n_steps, workers=None):
+    """
+    Compute state of the gas after n_steps steps using worker processes
+
+    Gives the same result as n_steps calls of lab.step
+
+    Parameters
+    ----------
+    gas : dict
+        Initial state of the gas
+    n_steps : int
+        Number of steps
+    workers : int, optional
+        Number of worker processes, number of CPUs by default
+
+    Returns
+    -------
+    dict
+        State of the gas after n_steps steps
+    """
+    width, height = gas["width"], gas["height"]
+    size = width * height
+    cells = lab.gas_to_cells(gas)
+    if size == 0 or n_steps == 0:
+        return lab.cells_to_gas(cells, width, height)
+    strips = split_rows(height, workers or os.cpu_count() or 1)
+    buffers = [shared_memory.SharedMemory(create=True, size=size)
+               for _ in range(2)]
+    try:
+        buffers[0].buf[:size] = cells
+        names = [buffer.name for buffer in buffers]
+        barrier = multiprocessing.Barrier(len(strips))
+        processes = [multiprocessing.Process(
+                         target=worker,
+                         args=(names, width, height, top, bottom,
+                               n_steps, barrier))
+                     for top, bottom in strips]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        if any(process.exitcode != 0 for process in processes):
+            raise RuntimeError("Worker process failed")
+        result = bytes(buffers[n_steps % 2].buf[:size])
+    finally:
+        for buffer in buffers:
+            buffer.close()
+            buffer.unlink()
+    return lab.cells_to_gas(result, width, height)
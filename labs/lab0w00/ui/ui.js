@@ -1,7 +1,7 @@
 "use strict";
 
 // RPC wrapper
-function invoke_rpc(method, args, timeout, on_done){
+function invoke_rpc(method, args, timeout, on_done, on_fail){
   $("#crash").hide();
   $("#timeout").hide();
   $("#rpc_spinner").show();
@@ -26,6 +26,9 @@ function invoke_rpc(method, args, timeout, on_done){
       }
     } else {
       $("#crash").show();
+      if (typeof(on_fail) != "undefined"){
+        on_fail();
+      }
     }
   }
 }
@@ -70,6 +73,12 @@ var step = 5;
 var lock = false;
 var draw = null;
 
+// gas kept on the server, the UI receives only changed cells
+var session = null;
+var stream = null;
+// true while the session of a new gas is being opened
+var opening = false;
+
 var polygon_cache = [];
 var polygon_counter = 0;
 var rectangle_cache = [];
@@ -168,6 +177,10 @@ function init_gui(){
 }
 
 function handle_state_select(value){
+  // stop the run, steps of the old gas must not reach the new one
+  handle_pause_button();
+  opening = true;
+
   // load state
 
   var resource_loaded = function( gas ){
@@ -176,9 +189,12 @@ function handle_state_select(value){
     height = gas.height;
     $("#current_state").text(value + ", a " + width + "x" + height + " square lattice gas");
     render();
+    open_session(gas);
   };
 
-  load_resource("/resources/gasses/"+value, resource_loaded);
+  // load_gas reads both JSON and binary gas files
+  invoke_rpc("/load_gas", {"path": "resources/gasses/"+value}, 0, resource_loaded,
+             function(){ opening = false; });
 
   cycle = 0;
   prev_cycle = -1;
@@ -194,6 +210,7 @@ function handle_simulate_button(){
     $("#step_simulation").hide();
     // flag update sequence to run
     lock = true;
+    open_stream();
   }
 }
 
@@ -210,6 +227,7 @@ function handle_pause_button(){
 
     // flag update sequence to stop
     lock = false;
+    close_stream();
   }
 }
 
@@ -380,7 +398,93 @@ function simulate_step_help(result){
   render();
 }
 
+function open_session(gas){
+  close_stream();
+  if (session !== null){
+    invoke_rpc("/close_session", {"session": session}, 0);
+  }
+  session = null;
+  opening = true;
+  invoke_rpc("/open_session", {"gas": gas}, 0, function(result){
+    session = result.session;
+    opening = false;
+    // let step_function continue
+    prev_cycle = -1;
+    if (lock){
+      open_stream();
+    }
+  });
+}
+
+function reopen_session(){
+  // the server lost the session, continue from the displayed state
+  close_stream();
+  session = null;
+  open_session({"width": width, "height": height, "state": state});
+}
+
+function open_stream(){
+  if (session === null || stream !== null){
+    return;
+  }
+  // server pushes diffs of every step until the stream is closed, a new
+  // frame is allowed by ack_frames after the previous one is rendered
+  var current = session;
+  stream = new EventSource("/stream/frames?session=" + session + "&interval=" + step);
+  stream.onmessage = function(event){
+    apply_diff(JSON.parse(event.data));
+    invoke_rpc("/ack_frames", {"session": current, "frames": 1}, 0);
+  };
+  stream.onerror = function(){
+    if (session === current){
+      reopen_session();
+    }
+  };
+}
+
+function close_stream(){
+  if (stream !== null){
+    stream.close();
+    stream = null;
+  }
+}
+
+var ITEM_BITS = [["u", 1], ["d", 2], ["l", 4], ["r", 8], ["w", 16]];
+
+function apply_diff(result){
+  // result.cells is [index, mask, index, mask, ...]
+  var cells = result.cells;
+  for (var i = 0; i < cells.length; i += 2){
+    var items = [];
+    for (var j in ITEM_BITS){
+      if (cells[i+1] & ITEM_BITS[j][1]){
+        items.push(ITEM_BITS[j][0]);
+      }
+    }
+    state[cells[i]] = items;
+  }
+  cycle = cycle + 1;
+  render();
+}
+
 function simulate_step(){
+  if (opening){
+    return;
+  }
+  if (session !== null){
+    var current = session;
+    invoke_rpc("/diff", {"session": session, "steps": 1}, 0, function(result){
+      // ignore diffs of a session replaced meanwhile
+      if (session === current){
+        apply_diff(result);
+      }
+    }, function(){
+      if (session === current){
+        reopen_session();
+      }
+    });
+    return;
+  }
   var args = { "gas": {
                         "width": width,
                         "height": height,
@@ -400,7 +504,8 @@ function init(){
   init_gui();
 
   var step_function = function(){
-    if(lock){
+    // while streaming, frames are pushed by the server
+    if(lock && stream === null && !opening){
       //if ((cycle > prev_cycle) && (Date.now() - prev_time > 50)){
       if (cycle > prev_cycle){
         // remember when this frame occurred
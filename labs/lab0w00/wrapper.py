@@ -1,4 +1,4 @@
-import lab, json
+import lab, json, time, threading
 from importlib import reload
 reload(lab) # this forces the student code to be reloaded when page is refreshed
 
@@ -10,7 +10,100 @@ def init():
 def next( d ):
   r = None
   # MUX
-  r = lab.step(d["gas"])
+  # "steps" lets the UI advance several steps with one request
+  r = lab.run(d["gas"], d.get("steps", 1))
   return r
 
+# Gases kept on the server between requests, so the UI sends the gas once
+# and receives only the cells changed by every step.
+# session id -> {"width", "height", "masks", "planes", "cycle", "credits"}
+MAX_SESSIONS = 16
+# restart reloads this module, sessions of other tabs are kept
+try:
+  sessions
+except NameError:
+  sessions = {}
+  session_counter = 0
+  sessions_lock = threading.Condition()
+
+def open_session( d ):
+  global session_counter
+  gas = d["gas"]
+  width, height = gas["width"], gas["height"]
+  with sessions_lock:
+    session_counter += 1
+    sessions[session_counter] = {"width": width,
+                                 "height": height,
+                                 "masks": lab.get_masks(width, height),
+                                 "planes": lab.gas_to_planes(gas),
+                                 "cycle": 0,
+                                 "credits": 0}
+    # forget the oldest sessions
+    while len(sessions) > MAX_SESSIONS:
+      del sessions[min(sessions)]
+    return {"session": session_counter}
+
+def close_session( d ):
+  with sessions_lock:
+    sessions.pop(d["session"], None)
+    # wake up streams of the session
+    sessions_lock.notify_all()
+
+def ack_frames( d ):
+  # allow the stream of the session to send "frames" more frames
+  with sessions_lock:
+    s = sessions.get(d["session"])
+    if s is None:
+      return False
+    s["credits"] += d.get("frames", 1)
+    sessions_lock.notify_all()
+    return True
+
+def diff( d ):
+  # advance the gas of the session and return changed cells as a flat list
+  # [index, mask, index, mask, ...], where mask is a bit mask of lab.BITS
+  with sessions_lock:
+    s = sessions[d["session"]]
+    old = s["planes"]
+    new = lab.advance(old, s["width"], s["height"], s["masks"], d.get("steps", 1))
+    s["planes"] = new
+    s["cycle"] += d.get("steps", 1)
+    changed = 0
+    for a, b in zip(old, new):
+      changed |= a ^ b
+    masks = lab.planes_to_cells(new, s["width"] * s["height"])
+    cells = []
+    bits = bin(changed)[:1:-1]
+    i = bits.find("1")
+    while i != -1:
+      cells += [i, masks[i]]
+      i = bits.find("1", i + 1)
+    return {"cycle": s["cycle"], "cells": cells}
+
+def _frames( params ):
+  # event stream of diffs, registered by server.py at /stream/frames
+  # params: session, steps (per frame, default 1), interval (ms, default 0),
+  # window (frames sent before the first ack_frames, default 2)
+  # every frame takes one credit given by ack_frames, so frames are not
+  # sent faster than the client renders them
+  session = int(params["session"])
+  steps = int(params.get("steps", 1))
+  interval = float(params.get("interval", 0)) / 1000
+  with sessions_lock:
+    if session in sessions:
+      sessions[session]["credits"] = int(params.get("window", 2))
+  while True:
+    with sessions_lock:
+      sessions_lock.wait_for(lambda: session not in sessions or
+                                     sessions[session]["credits"] > 0)
+      if session not in sessions:
+        return
+      sessions[session]["credits"] -= 1
+    try:
+      yield diff({"session": session, "steps": steps})
+    except KeyError:
+      # session closed meanwhile
+      return
+    time.sleep(interval)
+
 init()
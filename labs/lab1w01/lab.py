@@ -1,14 +1,50 @@
 #!/usr/bin/env python3
 
+import os
 import sys
 import math
 import base64
 import tkinter
+import operator
+import multiprocessing
+
+from array import array
+from collections import deque
+from itertools import accumulate
+from multiprocessing import shared_memory
 
 from io import BytesIO
 from PIL import Image as PILImage
 
-## NO ADDITIONAL IMPORTS ALLOWED!
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Compute filters with NumPy arrays when NumPy is installed
+USE_NUMPY = np is not None
+
+# Correlate images with at least this many pixels in worker processes
+PARALLEL_MIN_PIXELS = 1000000
+
+# Correlate NumPy arrays with FFT for kernels with at least this size
+FFT_MIN_KERNEL = 7
+
+# Number of kernel spectra kept for FFT correlation of next images
+FFT_CACHE_SIZE = 16
+
+# spectra of flipped kernels by kernel and FFT shape, least recent first
+_SPECTRA = {}
+
+
+# kernels for Sobel operator
+SOBEL_X = ((-1, 0, 1),
+           (-2, 0, 2),
+           (-1, 0, 1))
+SOBEL_Y = ((-1, -2, -1),
+           ( 0,  0,  0),
+           ( 1,  2,  1))
+
 
 def get_box_blur(n, total=1):
     """Create box blur with size n x n"""
@@ -16,7 +52,247 @@ def get_box_blur(n, total=1):
     return [[value for _ in range(n)] for _ in range(n)]
 
 
+def get_sharpen_kernel(n):
+    """Create sharpen kernel with size n x n"""
+    kernel = get_box_blur(n, total=-1)
+    center = n // 2
+    kernel[center][center] += 2
+    return kernel
+
+
+def luminance(data, channels):
+    """
+    Return list of luminances of pixels given as bytes of RGB channels
+
+    Equal to round(.299*r + .587*g + .114*b) for every pixel, channels is
+    number of bytes per pixel (3 for RGB, 4 for RGBA).
+    """
+    if USE_NUMPY:
+        rgb = np.frombuffer(data, dtype=np.uint8).reshape(-1, channels)
+        r, g, b = (rgb[:, i].astype(np.float64) for i in range(3))
+        # same order of operations as in the formula
+        return np.round(.299*r + .587*g + .114*b).astype(np.int64).tolist()
+    return [round(.299*r + .587*g + .114*b) for r, g, b in
+            zip(data[0::channels], data[1::channels], data[2::channels])]
+
+
+def compact_pixels(pixels):
+    """
+    Return copy of pixels stored in typed array
+
+    Integer pixels in [0..255] are stored as array('B') with one byte per
+    pixel, other pixels as array('d') with 8 bytes per pixel.
+    """
+    if isinstance(pixels, array):
+        return array(pixels.typecode, pixels)
+    try:
+        return array('B', pixels)
+    except (TypeError, OverflowError):
+        return array('d', pixels)
+
+
+def correlate_array(values, kernel, fft=False):
+    """
+    Create array, that is result of correlation of NumPy array with kernel
+
+    Pixels out of bounds are taken from the nearest bound as in
+    Image.get_pixel_alt. Kernel taps are summed in the same order as in
+    Image.correlate, so results are equal to it. With fft=True kernels
+    with at least FFT_MIN_KERNEL rows are correlated with FFT, which is
+    equal only after clip_array, see correlate_fft.
+    """
+    kernel_size = len(kernel)
+    kernel_shift = kernel_size // 2
+    kernel = np.array(kernel)
+    height, width = values.shape
+    result = np.zeros((height, width), dtype=np.result_type(values, kernel))
+    if values.size == 0:
+        return result
+    padded = np.pad(values, kernel_shift, mode='edge')
+    if fft and kernel_size >= FFT_MIN_KERNEL:
+        return correlate_fft(padded, kernel, result.dtype)
+    for dx in range(kernel_size):
+        for dy in range(kernel_size):
+            result += padded[dy:dy+height, dx:dx+width] * kernel[dy, dx]
+    return result
+
+
+def fft_length(n):
+    """Return smallest number >= n without prime factors except 2, 3, 5"""
+    best = p2 = 1
+    while best < n:
+        best *= 2
+    while p2 < best:
+        p3 = p2
+        while p3 < best:
+            p5 = p3
+            while p5 < n:
+                p5 *= 5
+            best = min(best, p5)
+            p3 *= 3
+        p2 *= 2
+    return best
+
+
+def correlate_fft(padded, kernel, dtype):
+    """
+    Correlate array padded by kernel_size // 2 pixels with FFT
+
+    Integer results are rounded, so they are equal to the direct sums.
+    Float results differ from the direct sums only by rounding errors,
+    except pixels close to .5 which are summed directly, so results are
+    equal to correlate_array after clip_array.
+    """
+    kernel_size = len(kernel)
+    height = padded.shape[0] - kernel_size + 1
+    width = padded.shape[1] - kernel_size + 1
+    shape = tuple(fft_length(n) for n in padded.shape)
+    # correlation is convolution with flipped kernel
+    spectrum = np.fft.rfft2(padded, shape) * kernel_spectrum(kernel, shape)
+    result = np.fft.irfft2(spectrum, shape)
+    result = result[kernel_size-1:kernel_size-1+height,
+                    kernel_size-1:kernel_size-1+width]
+    if dtype.kind in 'iu':
+        return np.rint(result).astype(dtype)
+    # bound of FFT errors is far below this tolerance
+    tolerance = 1e-9 * (np.abs(kernel).sum() * np.abs(padded).max() + 1)
+    ys, xs = np.nonzero(np.abs(result - np.floor(result) - 0.5) < tolerance)
+    if len(ys):
+        ties = np.zeros(len(ys), dtype=dtype)
+        for dx in range(kernel_size):
+            for dy in range(kernel_size):
+                ties += padded[ys+dy, xs+dx] * kernel[dy, dx]
+        result[ys, xs] = ties
+    return result
+
+
+def kernel_spectrum(kernel, shape):
+    """
+    Return FFT of flipped kernel with given shape
+
+    Spectra are cached, so images of the same size, such as frames of a
+    stream, transform every kernel once.
+    """
+    key = (kernel.tobytes(), kernel.shape, kernel.dtype.str, shape)
+    spectrum = _SPECTRA.pop(key, None)
+    if spectrum is None:
+        spectrum = np.fft.rfft2(kernel[::-1, ::-1], shape)
+    _SPECTRA[key] = spectrum
+    while len(_SPECTRA) > FFT_CACHE_SIZE:
+        del _SPECTRA[next(iter(_SPECTRA))]
+    return spectrum
+
+
+def box_sums(pixels, width, height, n):
+    """
+    Return sums of pixels in n x n box around every pixel
+
+    Pixels out of bounds are taken from the nearest bound. Computed by
+    two passes of running sums, so cost per pixel does not depend on n.
+    """
+    before = n // 2
+    after = n - 1 - before
+    # horizontal pass
+    rows = []
+    for y in range(height):
+        row = list(pixels[y*width:(y+1)*width])
+        row = [row[0]] * before + row + [row[-1]] * after
+        sums = [0, *accumulate(row)]
+        rows.append(list(map(operator.sub, sums[n:], sums[:width])))
+    # vertical pass over row sums
+    rows = [rows[0]] * before + rows + [rows[-1]] * after
+    sums = [[0] * width,
+            *accumulate(rows, lambda a, b: list(map(operator.add, a, b)))]
+    result = []
+    for y in range(height):
+        result.extend(map(operator.sub, sums[y+n], sums[y]))
+    return result
+
+
+def box_sums_array(values, n):
+    """Return sums of NumPy array values in n x n box around every value"""
+    before = n // 2
+    after = n - 1 - before
+    padded = np.pad(values, (before, after), mode='edge')
+    # summed-area table with zero first row and column
+    table = np.zeros((padded.shape[0] + 1, padded.shape[1] + 1),
+                     dtype=values.dtype)
+    table[1:, 1:] = padded.cumsum(0).cumsum(1)
+    return table[n:, n:] - table[:-n, n:] - table[n:, :-n] + table[:-n, :-n]
+
+
+def box_filter_ok(values, n):
+    """
+    Check that box sums give the same result as correlation with box kernel
+
+    Box sums of integer pixels are exact, and for odd n the exact mean
+    is never half-way between integers, so rounding it is equal to
+    rounding the correlation.
+    """
+    return n % 2 == 1 and values.size > 0 and values.dtype.kind in 'iu'
+
+
+def blurred_array(values, n):
+    """Create array as Image.blurred for NumPy array"""
+    if box_filter_ok(values, n):
+        return clip_array(box_sums_array(values, n) / (n * n))
+    return clip_array(correlate_array(values, get_box_blur(n), fft=True))
+
+
+def sharpened_array(values, n):
+    """Create array as Image.sharpened for NumPy array"""
+    if box_filter_ok(values, n):
+        # 2 * pixel - blurred pixel
+        size = n * n
+        return clip_array((2 * size * values - box_sums_array(values, n)) / size)
+    return clip_array(correlate_array(values, get_sharpen_kernel(n), fft=True))
+
+
+def edges_array(values):
+    """Create array as Image.edges for NumPy array"""
+    o_x = correlate_array(values, SOBEL_X)
+    o_y = correlate_array(values, SOBEL_Y)
+    return clip_array((o_x ** 2 + o_y ** 2) ** 0.5)
+
+
+def pixel_energy(rows, width, height, x, y):
+    """Compute Image.edges() value of pixel (x, y) of image given as rows"""
+    window = [rows[min(height-1, max(0, y-1+dy))] for dy in range(3)]
+    columns = [min(width-1, max(0, x-1+dx)) for dx in range(3)]
+    o_x = o_y = 0
+    # same order of summing as in Image.correlate
+    for dx in range(3):
+        column = columns[dx]
+        for dy in range(3):
+            color = window[dy][column]
+            o_x += color * SOBEL_X[dy][dx]
+            o_y += color * SOBEL_Y[dy][dx]
+    return min(255, max(0, round((o_x ** 2 + o_y ** 2) ** 0.5)))
+
+
+def invert_pixel(c):
+    """Return inverted pixel value"""
+    return 255 - c
+
+
+def invert_array(values):
+    """Create array with inverted values"""
+    return 255 - values
+
+
+def clip_pixel(c):
+    """Return pixel value rounded to integer in [0..255]"""
+    return min(255, max(0, round(c)))
+
+
+def clip_array(values):
+    """Create array with values are integer and in [0..255]"""
+    return np.clip(np.round(values), 0, 255).astype(np.int64)
+
+
 class Image:
+    __slots__ = ('width', 'height', 'pixels')
+
     def __init__(self, width, height, pixels):
         self.width = width
         self.height = height
@@ -46,6 +322,39 @@ class Image:
         """Set pixel value with coordinates (x, y) to c"""
         self.pixels[self._get_index(x, y)] = c
 
+    def to_array(self):
+        """Return pixels as NumPy array with shape (height, width)"""
+        if isinstance(self.pixels, array):
+            # same dtype as for list of ints or floats
+            dtype = np.int64 if self.pixels.typecode == 'B' else np.float64
+            values = np.frombuffer(self.pixels, dtype=self.pixels.typecode)
+            return values.astype(dtype).reshape(self.height, self.width)
+        return np.array(self.pixels).reshape(self.height, self.width)
+
+    @classmethod
+    def from_array(cls, values):
+        """Create image from NumPy array with shape (height, width)"""
+        height, width = values.shape
+        return cls(width, height, values.ravel().tolist())
+
+    def compact(self):
+        """
+        Create image with pixels stored in typed array
+
+        Clipped images take one byte per pixel, other images 8 bytes per
+        pixel instead of list of Python ints or floats.
+        """
+        return Image(self.width, self.height, compact_pixels(self.pixels))
+
+    def pipe(self):
+        """
+        Create lazy pipeline of filters for the image
+
+        Invoked as, for example:
+            i.pipe().invert().blur(3).sharpen(5).run()
+        """
+        return Pipeline(self)
+
     def apply_per_pixel(self, func):
         """Create a new image by apply func to each pixel"""
         result = Image.new(self.width, self.height)
@@ -60,20 +369,40 @@ class Image:
         """
         Create a new image with inverted pixels
         """
+        if USE_NUMPY:
+            return Image.from_array(255 - self.to_array())
         return self.apply_per_pixel(lambda c: 255-c)
 
     def clip(self):
         """Create image with pixels values are integer and in [0..255]"""
+        if USE_NUMPY:
+            return Image.from_array(clip_array(self.to_array()))
         result = Image.new(self.width, self.height)
         result.pixels = [min(255, max(0, round(c))) for c in self.pixels]
         return result
 
-    def correlate(self, kernel):
+    def correlate(self, kernel, workers=None):
         """
         Create image, that is result of correlation wih kernel
         
-        Kernel size is n x n where n is odd
+        Kernel size is n x n where n is odd. Large images are split into
+        bands of rows which are correlated by `workers` processes (number
+        of CPUs by default), workers=1 computes in this process. With
+        NumPy the default is 1, as vectorized correlation is faster than
+        sending the image to worker processes. Daemonic processes, such
+        as workers of Pipeline.stream, cannot start other processes, so
+        there the default is 1 too.
         """
+        if workers is None:
+            workers = 1
+            if not USE_NUMPY and \
+               self.width * self.height >= PARALLEL_MIN_PIXELS and \
+               not multiprocessing.current_process().daemon:
+                workers = os.cpu_count() or 1
+        if workers > 1 and self.height > 1:
+            return self._correlate_parallel(kernel, workers)
+        if USE_NUMPY:
+            return Image.from_array(correlate_array(self.to_array(), kernel))
         kernel_size = len(kernel)
         kernel_shift = kernel_size // 2
         result = Image.new(self.width, self.height)
@@ -89,35 +418,81 @@ class Image:
                 result.set_pixel(x, y, color)
         return result
 
+    def _correlate_parallel(self, kernel, workers):
+        """Correlate bands of rows in worker processes over shared memory"""
+        width, height = self.width, self.height
+        workers = min(workers, height)
+        bounds = [height * k // workers for k in range(workers + 1)]
+        size = width * height * array('d').itemsize
+        source = shared_memory.SharedMemory(create=True, size=size)
+        target = shared_memory.SharedMemory(create=True, size=size)
+        try:
+            with source.buf.cast('d') as view:
+                view[:] = array('d', self.pixels)
+            tasks = [(source.name, target.name, width, height, top, bottom,
+                      kernel) for top, bottom in zip(bounds, bounds[1:])]
+            with multiprocessing.Pool(workers) as pool:
+                pool.map(_correlate_band, tasks)
+            with target.buf.cast('d') as view:
+                pixels = view.tolist()
+        finally:
+            for memory in (source, target):
+                memory.close()
+                memory.unlink()
+        # integer image and kernel give integer result
+        if self._int_pixels() and \
+           all(type(k) is int for row in kernel for k in row):
+            pixels = [int(c) for c in pixels]
+        return Image(width, height, pixels)
+
+    def _box_filter_ok(self, n):
+        """Check that box sums give the same result as correlation"""
+        if n % 2 == 0 or self.width == 0 or self.height == 0:
+            return False
+        return self._int_pixels()
+
+    def _int_pixels(self):
+        """Check that all pixels are integers"""
+        if isinstance(self.pixels, array):
+            return self.pixels.typecode == 'B'
+        return all(type(c) is int for c in self.pixels)
+
     def blurred(self, n):
         """Create blurred image, where kernel has size n x n"""
+        if USE_NUMPY:
+            return Image.from_array(blurred_array(self.to_array(), n))
+        if self._box_filter_ok(n):
+            size = n * n
+            sums = box_sums(self.pixels, self.width, self.height, n)
+            return Image(self.width, self.height, [
+                min(255, max(0, round(s / size))) for s in sums])
         kernel = get_box_blur(n)
         result = self.correlate(kernel).clip()
         return result
 
     def sharpened(self, n):
         """Create sharpen image, where kernel has size n x n"""
-        # create sharp kernel
-        kernel = get_box_blur(n, total=-1)
-        center = n // 2
-        kernel[center][center] += 2
-        # apply correlation with that kernel
-        result = self.correlate(kernel).clip()
+        if USE_NUMPY:
+            return Image.from_array(sharpened_array(self.to_array(), n))
+        if self._box_filter_ok(n):
+            # 2 * pixel - blurred pixel
+            size = n * n
+            sums = box_sums(self.pixels, self.width, self.height, n)
+            return Image(self.width, self.height, [
+                min(255, max(0, round((2 * size * c - s) / size)))
+                for c, s in zip(self.pixels, sums)])
+        # apply correlation with sharp kernel
+        result = self.correlate(get_sharpen_kernel(n)).clip()
         return result
 
     def edges(self):
         """Create image, which edge detect by apply Sobel operator"""
+        if USE_NUMPY:
+            return Image.from_array(edges_array(self.to_array()))
         result = Image.new(self.width, self.height)
-        # defined kernels for Sobel operator
-        kernel_x = ((-1, 0, 1),
-                    (-2, 0, 2),
-                    (-1, 0, 1))
-        kernel_y = ((-1, -2, -1),
-                    ( 0,  0,  0),
-                    ( 1,  2,  1))
-        # apply correlation whith these kernels
-        o_x = self.correlate(kernel_x)
-        o_y = self.correlate(kernel_y)
+        # apply correlation whith Sobel kernels
+        o_x = self.correlate(SOBEL_X)
+        o_y = self.correlate(SOBEL_Y)
         # implement Sobel operator
         result.pixels = [(x ** 2 + y ** 2) ** 0.5
                         for x, y in zip(o_x.pixels, o_y.pixels)]
@@ -128,17 +503,28 @@ class Image:
         """Create new image without n 'minimum energy' columns"""
         if n >= self.width:
             return Image(0, self.height, [])
-        result = Image(self.width, self.height, self.pixels[:])
+        width, height = self.width, self.height
+        rows = [self.pixels[y*width:(y+1)*width] for y in range(height)]
+        # energy of every column, computed once for the whole image
+        energy = self.edges().pixels
+        column_energy = [sum(energy[x::width]) for x in range(width)]
         for _ in range(n):
-            # create energy map for the image
-            energy_map = result.edges()
-            # find index of minimum energy column
-            index = energy_map.min_energy_column()
+            # find index of minimum energy column, leftmost of equal
+            index = column_energy.index(min(column_energy))
             # delete this column from the image
-            result.pixels = [color for i, color in enumerate(result.pixels)
-                                   if i % result.width != index]
-            result.width -= 1
-        return result
+            for row in rows:
+                del row[index]
+            del column_energy[index]
+            width -= 1
+            # only energy of neighbor columns depends on deleted column
+            for x in (index-1, index):
+                if 0 <= x < width:
+                    column_energy[x] = sum(pixel_energy(rows, width, height, x, y)
+                                           for y in range(height))
+        pixels = []
+        for row in rows:
+            pixels.extend(row)
+        return Image(width, height, pixels)
 
     def min_energy_column(self):
         """Return index of minimum energy column"""
@@ -155,18 +541,11 @@ class Image:
 
     def seam_carving(self, n=1):
         """Create a new image without n 'minimum energy' path from top to down"""
-        result = Image(self.width, self.height, self.pixels[:])
+        carver = SeamCarver(self)
         # do repeatedly
         for _ in range(n):
-            # create energy map for the image
-            map = result.edges()
-            # transform energy map to cumulative energy map
-            map.transform_map()
-            # get seam coordinates from cumulative energy map
-            path = map.get_min_path()
-            # delete the seam from the image
-            result.delete_path(path)
-        return result
+            carver.remove_seam()
+        return carver.image()
 
     def transform_map(self):
         """Transform energy map to cumulative energy map"""
@@ -204,15 +583,21 @@ class Image:
         self.width -= 1
 
 
+
+
     # Below this point are utilities for loading, saving, and displaying
     # images, as well as for testing.
 
     def __eq__(self, other):
-        return all(getattr(self, i) == getattr(other, i)
-                   for i in ('height', 'width', 'pixels'))
+        if (self.height, self.width) != (other.height, other.width):
+            return False
+        # list and array pixels are compared by values
+        return self.pixels == other.pixels or (
+            len(self.pixels) == len(other.pixels) and
+            all(map(operator.eq, self.pixels, other.pixels)))
 
     @classmethod
-    def load(cls, fname):
+    def load(cls, fname, compact=False):
         """
         Loads an image from the given file and returns an instance of this
         class representing that image.  This also performs conversion to
@@ -220,19 +605,24 @@ class Image:
 
         Invoked as, for example:
            i = Image.load('test_images/cat.png')
+
+        With compact=True pixels are stored in array('B').
         """
         with open(fname, 'rb') as img_handle:
             img = PILImage.open(img_handle)
-            img_data = img.getdata()
+            # raw bytes of the image, one byte per channel
+            data = img.tobytes()
             if img.mode.startswith('RGB'):
-                pixels = [round(.299*p[0] + .587*p[1] + .114*p[2]) for p in img_data]
+                pixels = luminance(data, len(img.getbands()))
             elif img.mode == 'LA':
-                pixels = [p[0] for p in img_data]
+                pixels = list(data[0::2])
             elif img.mode == 'L':
-                pixels = list(img_data)
+                pixels = array('B', data) if compact else list(data)
             else:
                 raise ValueError('Unsupported image mode: %r' % img.mode)
             w, h = img.size
+            if compact and not isinstance(pixels, array):
+                pixels = compact_pixels(pixels)
             return cls(w, h, pixels)
 
     @classmethod
@@ -252,14 +642,31 @@ class Image:
         If fname is given as a file-like object, the file type will be
         determined by the 'mode' parameter.
         """
-        out = PILImage.new(mode='L', size=(self.width, self.height))
-        out.putdata(self.pixels)
+        out = self._pil_image()
         if isinstance(fname, str):
             out.save(fname)
         else:
             out.save(fname, mode)
         out.close()
 
+    def _pil_image(self):
+        """Create grayscale PIL image with pixels of the image"""
+        size = (self.width, self.height)
+        pixels = self.pixels
+        if isinstance(pixels, array):
+            if pixels.typecode == 'B':
+                return PILImage.frombytes('L', size, pixels.tobytes())
+            pixels = pixels.tolist()
+        else:
+            try:
+                # integer pixels in [0..255] are copied as one buffer
+                return PILImage.frombytes('L', size, bytes(pixels))
+            except (TypeError, ValueError):
+                pass
+        out = PILImage.new(mode='L', size=size)
+        out.putdata(pixels)
+        return out
+
     def gif_data(self):
         """
         Returns a base 64 encoded string containing the given image as a GIF
@@ -297,8 +704,7 @@ class Image:
             #  * grab the base64-encoded GIF data from the resized image
             #  * put that in a tkinter label
             #  * show that image on the canvas
-            new_img = PILImage.new(mode='L', size=(self.width, self.height))
-            new_img.putdata(self.pixels)
+            new_img = self._pil_image()
             new_img = new_img.resize((event.width, event.height), PILImage.NEAREST)
             buff = BytesIO()
             new_img.save(buff, 'GIF')
@@ -311,6 +717,311 @@ class Image:
         toplevel.bind('<Configure>', lambda e: canvas.configure(height=e.height, width=e.width))
 
 
+def fold_kernels(first, second):
+    """
+    Create kernel equal to correlation with first kernel, then with second
+
+    Both kernels have odd size, result has size of sum of sizes minus one.
+    """
+    size = len(first) + len(second) - 1
+    kernel = [[0] * size for _ in range(size)]
+    for j_y, row_2 in enumerate(second):
+        for j_x, k_2 in enumerate(row_2):
+            for i_y, row_1 in enumerate(first):
+                for i_x, k_1 in enumerate(row_1):
+                    kernel[i_y+j_y][i_x+j_x] += k_2 * k_1
+    return kernel
+
+
+class Pipeline:
+    """
+    Lazy chain of filters of an image, created by Image.pipe()
+
+    Pipeline() without image is applied to sequences of frames by
+    stream(). Nothing is computed before run(). Then adjacent per-pixel operations
+    (invert, clip, map) are done in one pass, adjacent correlations are
+    folded into one kernel, and with NumPy pixels stay in one array until
+    the result image is created. Other filters give the same result as
+    the Image methods. A folded kernel extends image edges once, so
+    pixels closer to the border than the folded kernel radius may differ
+    from correlating with the kernels one by one, and large kernels are
+    correlated with FFT, so unclipped pixels may differ by rounding errors.
+    """
+    def __init__(self, image=None, operations=()):
+        self.image = image
+        self.operations = tuple(operations)
+
+    def _then(self, *operations):
+        return Pipeline(self.image, self.operations + operations)
+
+    def map(self, func, array_func=None):
+        """
+        Apply func to every pixel, array_func to NumPy array if given
+
+        Functions are sent to worker processes of stream(), so with
+        workers > 1 they must be picklable (defined at module level).
+        """
+        return self._then(('pixel', (func, array_func)))
+
+    def invert(self):
+        return self.map(invert_pixel, invert_array)
+
+    def clip(self):
+        return self.map(clip_pixel, clip_array)
+
+    def correlate(self, kernel):
+        return self._then(('kernel', kernel))
+
+    def blur(self, n):
+        return self._then(('blur', n))
+
+    def sharpen(self, n):
+        return self._then(('sharpen', n))
+
+    def edges(self):
+        return self._then(('edges', None))
+
+    def seam_carving(self, n=1):
+        return self._then(('seams', n))
+
+    def stages(self):
+        """Return operations with per-pixel ones grouped and kernels folded"""
+        stages = []
+        for kind, arg in self.operations:
+            if stages and stages[-1][0] == kind == 'pixel':
+                stages[-1] = ('pixel', stages[-1][1] + [arg])
+            elif stages and stages[-1][0] == kind == 'kernel' and \
+                 len(stages[-1][1]) % 2 == 1 and len(arg) % 2 == 1:
+                stages[-1] = ('kernel', fold_kernels(stages[-1][1], arg))
+            elif kind == 'pixel':
+                stages.append(('pixel', [arg]))
+            else:
+                stages.append((kind, arg))
+        return stages
+
+    def run(self):
+        """Compute filters and return the result image"""
+        return _run_stages(self.image, self.stages())
+
+    def stream(self, frames, workers=None):
+        """
+        Apply filters to every frame of iterable, yield result images
+
+        Frames are images or names of image files. Stages and kernels are
+        prepared once for all frames. With workers > 1 (number of CPUs by
+        default) frames are processed in worker processes and at most
+        2 * workers frames are in flight, so memory does not grow with
+        length of the stream. Results are yielded in order of frames and
+        stored compactly (see Image.compact).
+        """
+        stages = self.stages()
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if workers <= 1:
+            for frame in frames:
+                yield _process_frame(frame, stages)
+            return
+        with multiprocessing.Pool(workers, _init_stream, (stages,)) as pool:
+            pending = deque()
+            for frame in frames:
+                if len(pending) >= 2 * workers:
+                    yield pending.popleft().get()
+                pending.append(pool.apply_async(_stream_frame, (frame,)))
+            while pending:
+                yield pending.popleft().get()
+
+
+def _run_stages(image, stages):
+    """Compute stages of pipeline for image"""
+    if USE_NUMPY:
+        values = image.to_array()
+        for kind, arg in stages:
+            if kind == 'pixel' and all(f is not None for _, f in arg):
+                for _, array_func in arg:
+                    values = array_func(values)
+            elif kind == 'pixel':
+                pixels = _apply_all(arg, values.ravel().tolist())
+                values = np.array(pixels).reshape(values.shape)
+            elif kind == 'kernel':
+                values = correlate_array(values, arg, fft=True)
+            elif kind == 'blur':
+                values = blurred_array(values, arg)
+            elif kind == 'sharpen':
+                values = sharpened_array(values, arg)
+            elif kind == 'seams':
+                values = Image.from_array(values).seam_carving(arg).to_array()
+            else:
+                values = edges_array(values)
+        return Image.from_array(values)
+    result = image
+    for kind, arg in stages:
+        if kind == 'pixel':
+            result = Image(result.width, result.height,
+                           _apply_all(arg, result.pixels))
+        elif kind == 'kernel':
+            result = result.correlate(arg)
+        elif kind == 'blur':
+            result = result.blurred(arg)
+        elif kind == 'sharpen':
+            result = result.sharpened(arg)
+        elif kind == 'seams':
+            result = result.seam_carving(arg)
+        else:
+            result = result.edges()
+    return result
+
+
+# stages of the stream computed by this worker process, every worker
+# process serves one stream
+_stream_stages = []
+
+
+def _init_stream(stages):
+    """Set stages of the stream, runs once in every worker process"""
+    global _stream_stages
+    _stream_stages = stages
+
+
+def _stream_frame(frame):
+    """Compute stages of the stream of the worker process for frame"""
+    return _process_frame(frame, _stream_stages)
+
+
+def _process_frame(frame, stages):
+    """Load frame if it is a file name and compute stages for it"""
+    if isinstance(frame, str):
+        frame = Image.load(frame, compact=True)
+    return _run_stages(frame, stages).compact()
+
+
+def _apply_all(funcs, pixels):
+    """Apply per-pixel functions of pipeline one after another in one pass"""
+    funcs = [func for func, _ in funcs]
+    result = []
+    for c in pixels:
+        for func in funcs:
+            c = func(c)
+        result.append(c)
+    return result
+
+
+def _correlate_band(task):
+    """
+    Correlate rows top..bottom-1 of an image in shared memory
+
+    Runs in a worker process of Image.correlate. The band is read with
+    kernel_size // 2 rows of overlap, so pixels are equal to correlation
+    of the whole image.
+    """
+    source_name, target_name, width, height, top, bottom, kernel = task
+    shift = len(kernel) // 2
+    start, stop = max(0, top - shift), min(height, bottom + shift)
+    source = shared_memory.SharedMemory(name=source_name)
+    target = shared_memory.SharedMemory(name=target_name)
+    try:
+        with source.buf.cast('d') as view:
+            pixels = view[start*width:stop*width].tolist()
+        band = Image(width, stop - start, pixels).correlate(kernel, workers=1)
+        rows = band.pixels[(top-start)*width:(bottom-start)*width]
+        with target.buf.cast('d') as view:
+            view[top*width:bottom*width] = array('d', rows)
+    finally:
+        source.close()
+        target.close()
+
+
+class SeamCarver:
+    """
+    Remove seams from an image one by one
+
+    Energy map and cumulative energy map are kept between seams, after a
+    seam is removed they are recomputed only near the seam: energy where
+    the Sobel window contains the seam, cumulative energy where it differs
+    from the value before removal. Results are equal to computing both
+    maps from scratch (edges, transform_map and get_min_path).
+    """
+    def __init__(self, image):
+        self.width = image.width
+        self.height = image.height
+        self.rows = [image.pixels[y*image.width:(y+1)*image.width]
+                     for y in range(image.height)]
+        energy = image.edges().pixels
+        self.energy = [energy[y*image.width:(y+1)*image.width]
+                       for y in range(image.height)]
+        # cumulative energy map as in Image.transform_map
+        self.cost = [self.energy[0][:]] if self.height else []
+        for y in range(1, self.height):
+            parents = self.cost[-1]
+            self.cost.append([e + self._min_parent(parents, x)
+                              for x, e in enumerate(self.energy[y])])
+
+    def _min_parent(self, parents, x):
+        """Return minimum of parents[x-1..x+1], indexes are clamped"""
+        return min(parents[max(0, x-1):x+2])
+
+    def find_seam(self):
+        """Return x coordinates of minimum energy seam from top to down"""
+        bottom = self.cost[-1]
+        x = min(range(self.width), key=lambda x: (bottom[x], x))
+        seam = [x]
+        # parents with minimum cost, leftmost of equal
+        for y in reversed(range(self.height-1)):
+            row = self.cost[y]
+            start = max(0, x-1)
+            x = min(range(start, min(self.width, x+2)),
+                    key=lambda x_p: (row[x_p], x_p))
+            seam.append(x)
+        seam.reverse()
+        return seam
+
+    def remove_seam(self):
+        """Remove minimum energy seam and update maps"""
+        seam = self.find_seam()
+        for y, x in enumerate(seam):
+            del self.rows[y][x]
+            del self.energy[y][x]
+            del self.cost[y][x]
+        self.width -= 1
+        if self.width == 0:
+            return
+        # dirty: range of columns in the previous row, where cost differs
+        # from the cost before removal
+        dirty = None
+        for y in range(self.height):
+            # Sobel windows containing the seam
+            near = seam[max(0, y-1):y+2]
+            lo, hi = max(0, min(near)-1), min(self.width-1, max(near))
+            energy = self.energy[y]
+            for x in range(lo, hi+1):
+                energy[x] = pixel_energy(self.rows, self.width,
+                                         self.height, x, y)
+            # cost may change in these columns, parents of other columns
+            # are the same pixels as before removal
+            near = seam[max(0, y-1):y+1]
+            lo = min(lo, min(near)-2)
+            hi = max(hi, max(near)+1)
+            if dirty is not None:
+                lo = min(lo, dirty[0]-1)
+                hi = max(hi, dirty[1]+1)
+            lo, hi = max(0, lo), min(self.width-1, hi)
+            cost = self.cost[y]
+            dirty = None
+            for x in range(lo, hi+1):
+                value = energy[x]
+                if y > 0:
+                    value += self._min_parent(self.cost[y-1], x)
+                if value != cost[x]:
+                    cost[x] = value
+                    dirty = (x, x) if dirty is None else (dirty[0], x)
+
+    def image(self):
+        """Return the image without removed seams"""
+        pixels = []
+        for row in self.rows:
+            pixels.extend(row)
+        return Image(self.width, self.height, pixels)
+
+
 try:
     tk_root = tkinter.Tk()
     tk_root.withdraw()
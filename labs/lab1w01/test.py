@@ -2,7 +2,15 @@
 
 import os
 import lab
+import pickle
+import random
+import tempfile
 import unittest
+import multiprocessing
+
+from unittest import mock
+
+from PIL import Image as PILImage
 
 TEST_DIRECTORY = os.path.dirname(__file__)
 
@@ -24,6 +32,40 @@ class TestImage(unittest.TestCase):
         self.assertEqual(result, expected)
 
 
+class TestLoadSave(unittest.TestCase):
+    def tearDown(self):
+        lab.USE_NUMPY = lab.np is not None
+
+    def test_luminance(self):
+        # luminance is rounded as round(.299*r + .587*g + .114*b)
+        for use_numpy in {False, lab.np is not None}:
+            lab.USE_NUMPY = use_numpy
+            for fname in ('cat', 'pattern', 'bluegill'):
+                with self.subTest(numpy=use_numpy, f=fname):
+                    inpfile = os.path.join(TEST_DIRECTORY, 'test_images', '%s.png' % fname)
+                    with PILImage.open(inpfile) as img:
+                        rgb = img.convert('RGB')
+                        data = rgb.tobytes()
+                        expected = [round(.299*data[i] + .587*data[i+1] + .114*data[i+2])
+                                    for i in range(0, len(data), 3)]
+                        if img.mode == 'L':
+                            expected = list(img.tobytes())
+                    self.assertEqual(lab.Image.load(inpfile).pixels, expected)
+            rng = random.Random(6009)
+            colors = [[rng.randrange(256) for _ in range(3)] for _ in range(10000)]
+            self.assertEqual(lab.luminance(bytes(sum(colors, [])), 3),
+                             [round(.299*r + .587*g + .114*b) for r, g, b in colors])
+
+    def test_save(self):
+        # saved image is loaded with the same pixels
+        for im in (lab.Image.load('test_images/cat.png'),
+                   lab.Image(3, 2, [0, 255, 7.0, 100, 3, 44])):
+            with self.subTest(w=im.width), tempfile.TemporaryDirectory() as tmp:
+                fname = os.path.join(tmp, 'image.png')
+                im.save(fname)
+                self.assertEqual(lab.Image.load(fname), im)
+
+
 class TestInvert(unittest.TestCase):
     def test_invert_1(self):
         im = lab.Image.load('test_images/centered_pixel.png')
@@ -229,5 +271,342 @@ class TestFilters(unittest.TestCase):
         self.assertEqual(result, expected)
 
 
+class TestBoxFilter(unittest.TestCase):
+    def setUp(self):
+        self.images = [lab.Image.load('test_images/%s.png' % name)
+                       for name in ('centered_pixel', 'pattern', 'blob')]
+        self.images.append(lab.Image(4, 3, [-40, 7, 300, 267, -8, 12,
+                                            9, 32, 629, 0, 1, 2]))
+
+    def tearDown(self):
+        lab.USE_NUMPY = lab.np is not None
+
+    def test_box_filters(self):
+        # box sums give the same result as correlation with box kernel
+        for use_numpy in {False, lab.np is not None}:
+            for im in self.images:
+                for n in (1, 3, 5, 9, 15):
+                    with self.subTest(numpy=use_numpy, w=im.width, n=n):
+                        lab.USE_NUMPY = use_numpy
+                        blur = lab.get_box_blur(n)
+                        sharp = lab.get_box_blur(n, total=-1)
+                        sharp[n // 2][n // 2] += 2
+                        self.assertEqual(im.blurred(n), im.correlate(blur).clip())
+                        self.assertEqual(im.sharpened(n), im.correlate(sharp).clip())
+
+
+class TestCompact(unittest.TestCase):
+    def setUp(self):
+        self.images = [lab.Image.load('test_images/%s.png' % name)
+                       for name in ('centered_pixel', 'pattern', 'mushroom')]
+        self.images.append(lab.Image(4, 3, [-40, 7, 300, 267.5, -8, 12,
+                                            9, 32, 629, 0, 1, 2]))
+
+    def tearDown(self):
+        lab.USE_NUMPY = lab.np is not None
+
+    def test_storage(self):
+        # clipped pixels take one byte, others are stored as doubles
+        for im in self.images:
+            compact = im.compact()
+            self.assertEqual(compact, im)
+            self.assertEqual(im, compact)
+            typecode = 'B' if im == im.clip() else 'd'
+            self.assertEqual(compact.pixels.typecode, typecode)
+        # compact image of compact image has its own pixels
+        compact = self.images[0].compact()
+        other = compact.compact()
+        other.set_pixel(0, 0, 99)
+        self.assertEqual(compact, self.images[0])
+        im = lab.Image.load('test_images/mushroom.png', compact=True)
+        self.assertEqual(im.pixels.typecode, 'B')
+        self.assertEqual(im, self.images[2])
+        self.assertFalse(hasattr(im, '__dict__'))
+        im.set_pixel(2, 1, 17)
+        self.assertEqual(im.get_pixel(2, 1), 17)
+        self.assertNotEqual(im, self.images[2])
+
+    def test_filters(self):
+        # filters of compact image are equal to filters of list image
+        for use_numpy in {False, lab.np is not None}:
+            lab.USE_NUMPY = use_numpy
+            for im in self.images:
+                compact = im.compact()
+                with self.subTest(numpy=use_numpy, w=im.width):
+                    self.assertEqual(compact.inverted(), im.inverted())
+                    self.assertEqual(compact.blurred(3), im.blurred(3))
+                    self.assertEqual(compact.sharpened(5), im.sharpened(5))
+                    self.assertEqual(compact.edges(), im.edges())
+                    self.assertEqual(compact.correlate(lab.SOBEL_X, workers=2),
+                                     im.correlate(lab.SOBEL_X, workers=1))
+
+    def test_save(self):
+        # compact image is saved with the same pixels
+        for im in self.images[2:]:
+            with self.subTest(w=im.width), tempfile.TemporaryDirectory() as tmp:
+                fname = os.path.join(tmp, 'image.png')
+                im.compact().save(fname)
+                self.assertEqual(lab.Image.load(fname), im.clip())
+
+
+class TestParallelCorrelate(unittest.TestCase):
+    def tearDown(self):
+        lab.USE_NUMPY = lab.np is not None
+
+    def test_parallel(self):
+        # correlation in bands is equal to correlation of the whole image
+        rng = random.Random(6009)
+        images = [lab.Image.load('test_images/pattern.png'),
+                  lab.Image(20, 15, [rng.random() * 255 for _ in range(300)])]
+        kernels = [lab.SOBEL_X,
+                   [[rng.random() for _ in range(5)] for _ in range(5)],
+                   lab.get_box_blur(9)]
+        for use_numpy in {False, lab.np is not None}:
+            lab.USE_NUMPY = use_numpy
+            for im in images:
+                for kernel in kernels:
+                    expected = im.correlate(kernel, workers=1)
+                    for workers in (2, 4):
+                        with self.subTest(numpy=use_numpy, w=im.width,
+                                          k=len(kernel), workers=workers):
+                            result = im.correlate(kernel, workers=workers)
+                            self.assertEqual(result, expected)
+
+
+    def test_default_workers(self):
+        # large images are split into bands by default only without NumPy
+        im = lab.Image.load('test_images/pattern.png')
+        expected = im.correlate(lab.SOBEL_X, workers=1)
+        for use_numpy in {False, lab.np is not None}:
+            lab.USE_NUMPY = use_numpy
+            with self.subTest(numpy=use_numpy), \
+                 mock.patch.object(lab, 'PARALLEL_MIN_PIXELS', 1), \
+                 mock.patch.object(lab.os, 'cpu_count', return_value=2), \
+                 mock.patch.object(lab.Image, '_correlate_parallel',
+                                   autospec=True, return_value=expected) as parallel:
+                self.assertEqual(im.correlate(lab.SOBEL_X), expected)
+                self.assertEqual(parallel.called, not use_numpy)
+
+
+class TestPipeline(unittest.TestCase):
+    def tearDown(self):
+        lab.USE_NUMPY = lab.np is not None
+
+    def test_pipeline(self):
+        # pipeline gives the same result as the image methods
+        im = lab.Image.load('test_images/pattern.png')
+        for use_numpy in {False, lab.np is not None}:
+            with self.subTest(numpy=use_numpy):
+                lab.USE_NUMPY = use_numpy
+                expected = im.inverted().blurred(3).sharpened(5).edges()
+                result = im.pipe().invert().blur(3).sharpen(5).edges().run()
+                self.assertEqual(result, expected)
+                expected = im.correlate(lab.SOBEL_X).inverted().clip()
+                result = im.pipe().correlate(lab.SOBEL_X).map(lambda c: 255-c).clip().run()
+                self.assertEqual(result, expected)
+
+    def test_stages(self):
+        im = lab.Image(3, 3, [0] * 9)
+        pipeline = im.pipe().invert().clip().correlate(lab.SOBEL_X) \
+                     .correlate(lab.get_box_blur(3)).blur(3).invert()
+        self.assertEqual([kind for kind, _ in pipeline.stages()],
+                         ['pixel', 'kernel', 'blur', 'pixel'])
+        self.assertEqual(len(pipeline.stages()[1][1]), 5)
+
+    def test_folded_kernels(self):
+        # folded kernels give the same result far from the border
+        im = lab.Image.load('test_images/centered_pixel.png')
+        kernel_1 = ((0, 0.2, 0), (0.2, 0.2, 0.2), (0, 0.2, 0))
+        kernel_2 = lab.get_sharpen_kernel(3)
+        expected = im.correlate(kernel_1).correlate(kernel_2)
+        result = im.pipe().correlate(kernel_1).correlate(kernel_2).run()
+        for x in range(2, im.width - 2):
+            for y in range(2, im.height - 2):
+                self.assertAlmostEqual(result.get_pixel(x, y),
+                                       expected.get_pixel(x, y))
+
+    def test_stream(self):
+        # frames of stream are equal to filters applied one by one
+        names = ['test_images/%s.png' % name for name in ('pattern', 'mushroom')]
+        images = [lab.Image(4, 3, [-40, 7, 300, 267.5, -8, 12, 9, 32, 629, 0, 1, 2])]
+        pipeline = lab.Pipeline().blur(3).edges().seam_carving(2)
+        for use_numpy in {False, lab.np is not None}:
+            lab.USE_NUMPY = use_numpy
+            expected = [im.blurred(3).edges().seam_carving(2) for im in
+                        images + [lab.Image.load(name) for name in names]]
+            for workers in (1, 2):
+                with self.subTest(numpy=use_numpy, workers=workers):
+                    result = pipeline.stream(iter(images + names), workers=workers)
+                    self.assertEqual(list(result), expected)
+
+    def test_stream_bounded(self):
+        # frames are taken from iterator only when there is place for them
+        im = lab.Image.load('test_images/pattern.png')
+        taken = []
+        def frames():
+            for i in range(100):
+                taken.append(i)
+                yield im
+        stream = lab.Pipeline().invert().stream(frames(), workers=2)
+        self.assertEqual(next(stream), im.inverted())
+        self.assertLessEqual(len(taken), 5)
+        self.assertEqual(len(list(stream)), 99)
+
+    def test_stream_interleaved(self):
+        # streams read in turns keep their own filters
+        im = lab.Image.load('test_images/pattern.png')
+        inverted = lab.Pipeline().invert().stream([im, im], workers=1)
+        blurred = lab.Pipeline().blur(3).stream([im, im], workers=1)
+        self.assertEqual(next(inverted), im.inverted())
+        self.assertEqual(next(blurred), im.blurred(3))
+        self.assertEqual(next(inverted), im.inverted())
+        self.assertEqual(next(blurred), im.blurred(3))
+
+    def test_stream_spawn(self):
+        # built-in filters are sent to workers started by spawn
+        im = lab.Image.load('test_images/pattern.png')
+        pipeline = lab.Pipeline().invert().clip().blur(3)
+        pickle.dumps(pipeline.stages())
+        spawn = multiprocessing.get_context('spawn')
+        with mock.patch.object(lab.multiprocessing, 'Pool', spawn.Pool):
+            result = list(pipeline.stream([im, im], workers=2))
+        self.assertEqual(result, [im.inverted().clip().blurred(3)] * 2)
+
+    def test_stream_large_frames(self):
+        # workers of stream correlate large frames in their own process
+        im = lab.Image.load('test_images/pattern.png')
+        lab.USE_NUMPY = False
+        with mock.patch.object(lab, 'PARALLEL_MIN_PIXELS', 1), \
+             mock.patch.object(lab.os, 'cpu_count', return_value=4):
+            result = list(lab.Pipeline().edges().stream([im, im], workers=2))
+        self.assertEqual(result, [im.edges()] * 2)
+
+
+class TestShrink(unittest.TestCase):
+    def full_shrink(self, im, n):
+        # shrink with energy map computed from scratch for every column
+        result = lab.Image(im.width, im.height, im.pixels[:])
+        for _ in range(n):
+            index = result.edges().min_energy_column()
+            result.pixels = [c for i, c in enumerate(result.pixels)
+                             if i % result.width != index]
+            result.width -= 1
+        return result
+
+    def test_random(self):
+        rng = random.Random(6009)
+        for i in range(100):
+            width, height = rng.randint(2, 12), rng.randint(1, 10)
+            values = rng.choice((2, 4, 256))
+            im = lab.Image(width, height, [rng.randrange(values)
+                                           for _ in range(width * height)])
+            n = rng.randint(1, width - 1)
+            with self.subTest(i=i, w=width, h=height, n=n):
+                self.assertEqual(im.shrink(n), self.full_shrink(im, n))
+
+    def test_answers(self):
+        for fname, n in (('pattern', 2), ('twocats', 100), ('tree', 75), ('pigbird', 100)):
+            with self.subTest(f=fname):
+                inpfile = os.path.join(TEST_DIRECTORY, 'test_images', '%s.png' % fname)
+                expfile = os.path.join(TEST_DIRECTORY, 'answers', '%s_shrink_%02d.png' % (fname, n))
+                result = lab.Image.load(inpfile).shrink(n)
+                expected = lab.Image.load(expfile)
+                self.assertEqual(result, expected)
+
+
+class TestSeamCarving(unittest.TestCase):
+    def full_seam_carving(self, im, n):
+        # seam carving with energy maps computed from scratch for every seam
+        result = lab.Image(im.width, im.height, im.pixels[:])
+        for _ in range(n):
+            energy_map = result.edges()
+            energy_map.transform_map()
+            result.delete_path(energy_map.get_min_path())
+        return result
+
+    def test_random(self):
+        rng = random.Random(6009)
+        for i in range(100):
+            width, height = rng.randint(2, 12), rng.randint(1, 10)
+            values = rng.choice((2, 4, 256))
+            im = lab.Image(width, height, [rng.randrange(values)
+                                           for _ in range(width * height)])
+            n = rng.randint(1, width - 1)
+            with self.subTest(i=i, w=width, h=height, n=n):
+                self.assertEqual(im.seam_carving(n), self.full_seam_carving(im, n))
+
+    def test_answers(self):
+        for fname, n in (('twocats', 100), ('tree', 75)):
+            with self.subTest(f=fname):
+                inpfile = os.path.join(TEST_DIRECTORY, 'test_images', '%s.png' % fname)
+                expfile = os.path.join(TEST_DIRECTORY, 'answers', '%s_seam_carving_%02d.png' % (fname, n))
+                result = lab.Image.load(inpfile).seam_carving(n)
+                expected = lab.Image.load(expfile)
+                self.assertEqual(result, expected)
+
+
+@unittest.skipIf(lab.np is None, 'NumPy is not installed')
+class TestNumpy(unittest.TestCase):
+    def setUp(self):
+        self.images = [lab.Image.load('test_images/%s.png' % name)
+                       for name in ('centered_pixel', 'pattern', 'mushroom')]
+        self.images.append(lab.Image(3, 3, [-4, 7, 2.2, 267, -8, 12.4, 9, 32, 629.7]))
+
+    def tearDown(self):
+        lab.USE_NUMPY = True
+
+    def compare(self, func):
+        # func gives the same result with and without NumPy
+        for im in self.images:
+            with self.subTest(w=im.width, h=im.height):
+                lab.USE_NUMPY = False
+                expected = func(im)
+                lab.USE_NUMPY = True
+                result = func(im)
+                self.assertEqual(result, expected)
+
+    def test_inverted(self):
+        self.compare(lambda im: im.inverted())
+
+    def test_clip(self):
+        self.compare(lambda im: im.clip())
+
+    def test_correlate(self):
+        kernel = ((0, 0.2, 0, 1, 0),
+                  (0.1, 0.2, 0.3, 0.4, 0.5),
+                  (-1, 0, 0, 0, 7),
+                  (0, 0, 0.6, 0, 0),
+                  (2, 0, 0, 0, 1 / 3))
+        self.compare(lambda im: im.correlate(kernel))
+        self.compare(lambda im: im.correlate(((1, 2, 1), (0, 0, 0), (-1, -2, -1))))
+
+    def test_filters(self):
+        for n in (1, 3, 5):
+            with self.subTest(n=n):
+                self.compare(lambda im: im.blurred(n))
+                self.compare(lambda im: im.sharpened(n))
+        self.compare(lambda im: im.edges())
+
+    def test_correlate_fft(self):
+        # large kernels are correlated with FFT, equal after clip
+        rng = random.Random(6009)
+        kernels = [lab.get_box_blur(7), lab.get_sharpen_kernel(11),
+                   [[0.5] * 9 for _ in range(9)],
+                   [[rng.randint(-3, 3) for _ in range(7)] for _ in range(7)],
+                   [[rng.random() - 0.5 for _ in range(15)] for _ in range(15)]]
+        for im in self.images:
+            array = im.to_array()
+            for kernel in kernels:
+                with self.subTest(w=im.width, n=len(kernel)):
+                    expected = lab.correlate_array(array, kernel)
+                    result = lab.correlate_array(array, kernel, fft=True)
+                    self.assertTrue((lab.clip_array(result) == lab.clip_array(expected)).all())
+                    if expected.dtype.kind == 'i':
+                        # integer image and kernel give the same integers
+                        self.assertTrue((result == expected).all())
+        # blur of float image is correlated with FFT
+        self.compare(lambda im: im.blurred(9))
+
+
 if __name__ == '__main__':
     res = unittest.main(verbosity=3, exit=False)
@@ -1,16 +1,39 @@
-# NO IMPORTS ALLOWED!
-
+import os
 import json
+import hashlib
+
+from array import array
+from bisect import bisect_left
+from itertools import accumulate, chain, compress, repeat
+from operator import add, floordiv, itemgetter, mod, mul, ne
 
 BACON_NUMBER = 4724
 
+# Number of datasets which actor graphs and name indexes are kept
+GRAPH_CACHE_SIZE = 4
+
+# Number of actors which BFS trees are kept by every actor graph
+TREE_CACHE_SIZE = 8
+
+# Directory where BFS trees are kept between runs, None to keep them in
+# memory only
+CACHE_DIR = None
+
+# Version of format of graph snapshot files
+SNAPSHOT_VERSION = 1
+
+# arrays of ActorGraph stored in snapshot and their typecodes
+SNAPSHOT_PARTS = (('ids', 'q'), ('movie_ids', 'q'), ('targets', 'i'),
+                  ('offsets', 'q'), ('movies', 'i'), ('movie_offsets', 'q'),
+                  ('cast', 'q'), ('cast_offsets', 'q'))
+
+# (data, size of data, index) by id of data, least recently used first
+_graphs = {}
+_names = {}
+
 def did_x_and_y_act_together(data, actor_id_1, actor_id_2):
     """Do two actors play in the same move?"""
-    for id_1, id_2, _ in data:
-        if id_1 == actor_id_1 and id_2 == actor_id_2 or \
-           id_1 == actor_id_2 and id_2 == actor_id_1:
-            return True
-    return False
+    return get_actor_graph(data).acted_together(actor_id_1, actor_id_2)
 
 
 def get_actor_id(data, name):
@@ -20,9 +43,26 @@ def get_actor_id(data, name):
 
 def get_actor_name(data, actor_id):
     """Return actor name in data by his/her id. Actor present in data"""
-    for name, other_id in data.items():
-        if actor_id == other_id:
-            return name
+    return get_name_index(data).get(actor_id)
+
+
+def get_actor_names(data, actor_ids):
+    """Return list of actor names in data by their ids"""
+    names = get_name_index(data)
+    return [names.get(actor_id) for actor_id in actor_ids]
+
+
+def get_name_index(data):
+    """Return {actor_id: name} for names data, built once for the same data object"""
+    return _memoized(_names, data, _reverse_names)
+
+
+def _reverse_names(data):
+    names = {}
+    for name, actor_id in data.items():
+        # first name of the id, as found by scanning data
+        names.setdefault(actor_id, name)
+    return names
 
 
 def get_actors_with_bacon_number(data, n):
@@ -30,19 +70,386 @@ def get_actors_with_bacon_number(data, n):
     # if Bacon number is 0 return Bacon id
     if n == 0:
         return {BACON_NUMBER}
-    # actors graph is {actor_id: {set of other_actor_ids act with actor}}
-    id_graph = get_actors_graph(data)
-    id_set = closed = {BACON_NUMBER}
-    for i in range(n):
-        aux = set()
-        for actor_id in id_set:
-            aux |= set(id_graph[actor_id])
-        id_set = aux - closed
-        # if actors set empty stop computing
-        if len(id_set) == 0:
-            break
-        closed |= id_set
-    return id_set
+    return get_actor_graph(data).layer(BACON_NUMBER, n)
+
+
+def get_actor_graph(data):
+    """
+    Return ActorGraph of data, built once for the same data object
+
+    Graphs of the last GRAPH_CACHE_SIZE datasets are kept, so queries on
+    the same data do not walk all the data again. ActorGraph given as
+    data, for example from load_graph, is returned as is.
+    """
+    if isinstance(data, ActorGraph):
+        return data
+    return _memoized(_graphs, data, ActorGraph)
+
+
+def load_graph(fname):
+    """
+    Return ActorGraph of movie database JSON file fname
+
+    The graph is kept in binary snapshot file fname + '.graph' and built
+    from JSON only when modification time or size of fname changed. The
+    graph is accepted by all functions in place of data.
+    """
+    stat = os.stat(fname)
+    key = (SNAPSHOT_VERSION, stat.st_mtime_ns, stat.st_size)
+    graph = ActorGraph.load(fname + '.graph', key)
+    if graph is None:
+        with open(fname) as f:
+            graph = ActorGraph(json.load(f))
+        graph.digest()
+        try:
+            graph.save(fname + '.graph', key)
+        except OSError:
+            pass
+        # graph loaded from snapshot has no data too
+        graph.data = None
+    return graph
+
+
+def _memoized(cache, data, build):
+    """Return build(data) kept in cache by identity of data"""
+    entry = cache.pop(id(data), None)
+    # id of a freed object can be taken by a new one
+    if entry is None or entry[0] is not data or entry[1] != len(data):
+        entry = (data, len(data), build(data))
+    cache[id(data)] = entry
+    while len(cache) > GRAPH_CACHE_SIZE:
+        del cache[next(iter(cache))]
+    return entry[2]
+
+
+def compress_rows(rows, values, n, typecode='q'):
+    """
+    Group values by rows numbered 0..n-1 as compressed sparse rows
+
+    Return (offsets, result), values of row i are
+    result[offsets[i]:offsets[i+1]], sorted and without repeats, result
+    is array of typecode. Values are added to set of their row in one
+    pass, then the sets are sorted and joined at once.
+    """
+    groups = [set() for _ in range(n)]
+    for i, value in zip(rows, values):
+        groups[i].add(value)
+    offsets = array('q', accumulate(map(len, groups), initial=0))
+    return offsets, array(typecode, chain.from_iterable(map(sorted, groups)))
+
+
+class ActorGraph:
+    """
+    Index of actors of data who act together, created by get_actor_graph
+
+    Actors are numbered in order of appearance in data, ids[i] is id of
+    actor number i. Numbers of actors who act with actor i are
+    targets[offsets[i]:offsets[i+1]] (compressed sparse rows), so whole
+    graph is kept in arrays instead of dict of sets. Movies are numbered
+    the same way, movie_ids[m] is id of movie number m. Numbers of movies
+    of pair of actors at targets[e] are movies[movie_offsets[e]:
+    movie_offsets[e+1]], numbers of actors of movie m are
+    cast[cast_offsets[m]:cast_offsets[m+1]]. Movie arrays are built on
+    the first movie or cast query, so paths and Bacon numbers do not wait
+    for them.
+
+    BFS trees of the last TREE_CACHE_SIZE source actors are kept, so
+    layers and paths from these actors are looked up without search.
+    """
+    def __init__(self, data):
+        self.data = data
+        self.size = len(data)
+        # BFS trees by number of source actor, least recently used first
+        self.trees = {}
+        self._digest = None
+        # {actor_id: actor number}
+        ids = dict.fromkeys(chain.from_iterable(map(itemgetter(0, 1), data)))
+        self.index = dict(zip(ids, range(len(ids))))
+        self.ids = array('q', self.index)
+        self.offsets, self.targets = compress_rows(*self._pairs(), len(self.ids), 'i')
+        # {movie_id: movie number}, None until the first movie or cast query
+        self.movie_index = None
+
+    def _pairs(self):
+        """Return numbers of actors of pairs of data in both directions as (sources, others)"""
+        firsts = list(map(self.index.__getitem__, map(itemgetter(0), self.data)))
+        seconds = list(map(self.index.__getitem__, map(itemgetter(1), self.data)))
+        return firsts + seconds, seconds + firsts
+
+    def _index_movies(self):
+        """Build movie_ids, movies and cast arrays of data, if not built yet"""
+        if self.movie_index is not None:
+            return
+        movie_ids = dict.fromkeys(map(itemgetter(2), self.data))
+        movie_index = dict(zip(movie_ids, range(len(movie_ids))))
+        self.movie_ids = array('q', movie_index)
+        m = len(self.movie_ids)
+        movies = list(map(movie_index.__getitem__, map(itemgetter(2), self.data))) * 2
+        sources, others = self._pairs()
+        self.cast_offsets, self.cast = compress_rows(movies, sources, m)
+        # movie of pair as other_actor * m + movie, rows sorted as targets
+        pair_offsets, pairs = compress_rows(
+            sources, map(add, map(mul, others, repeat(m)), movies), len(self.ids))
+        self.movies = array('i', map(mod, pairs, repeat(m)))
+        # movies of the next pair start where other actor changes or a
+        # new row starts
+        pair_others = array('i', map(floordiv, pairs, repeat(m)))
+        starts = bytearray(map(ne, pair_others, chain([-1], pair_others)))
+        for e in pair_offsets[:-1]:
+            starts[e] = 1
+        self.movie_offsets = array('q', compress(range(len(pairs)), starts))
+        self.movie_offsets.append(len(pairs))
+        self.movie_index = movie_index
+
+    def neighbors(self, actor_id):
+        """Return set of ids of actors who act with actor_id"""
+        i = self.index.get(actor_id)
+        if i is None:
+            return set()
+        return {self.ids[j] for j in self.targets[self.offsets[i]:self.offsets[i+1]]}
+
+    def save(self, fname, key):
+        """Save arrays of graph to snapshot file with key of source data"""
+        self._index_movies()
+        parts = [getattr(self, name) for name, _ in SNAPSHOT_PARTS]
+        header = array('q', [*key, self.size] + [len(part) for part in parts])
+        with open(fname + '.tmp', 'wb') as f:
+            header.tofile(f)
+            f.write(self.digest().encode())
+            for part in parts:
+                part.tofile(f)
+        # other processes never see half written file
+        os.replace(fname + '.tmp', fname)
+
+    @classmethod
+    def load(cls, fname, key):
+        """Load graph from snapshot file, None if it is absent or has other key"""
+        try:
+            with open(fname, 'rb') as f:
+                header = array('q')
+                header.fromfile(f, len(key) + 1 + len(SNAPSHOT_PARTS))
+                if tuple(header[:len(key)]) != key:
+                    return None
+                graph = cls.__new__(cls)
+                graph._digest = f.read(40).decode()
+                for (name, typecode), size in zip(SNAPSHOT_PARTS, header[len(key)+1:]):
+                    part = array(typecode)
+                    part.fromfile(f, size)
+                    setattr(graph, name, part)
+        except (OSError, EOFError, ValueError):
+            return None
+        graph.data = None
+        graph.size = header[len(key)]
+        graph.trees = {}
+        graph.index = dict(zip(graph.ids, range(len(graph.ids))))
+        graph.movie_index = dict(zip(graph.movie_ids, range(len(graph.movie_ids))))
+        return graph
+
+    def _edge(self, actor_id_1, actor_id_2):
+        """Return position of actor_id_2 in row of actor_id_1 in targets, -1 if absent"""
+        i = self.index.get(actor_id_1)
+        j = self.index.get(actor_id_2)
+        if i is None or j is None:
+            return -1
+        e = bisect_left(self.targets, j, self.offsets[i], self.offsets[i+1])
+        if e < self.offsets[i+1] and self.targets[e] == j:
+            return e
+        return -1
+
+    def acted_together(self, actor_id_1, actor_id_2):
+        """Do two actors play in the same movie?"""
+        return self._edge(actor_id_1, actor_id_2) >= 0
+
+    def movies_together(self, actor_id_1, actor_id_2):
+        """Return set of ids of movies where both actors play"""
+        e = self._edge(actor_id_1, actor_id_2)
+        if e < 0:
+            return set()
+        self._index_movies()
+        movies = self.movies[self.movie_offsets[e]:self.movie_offsets[e+1]]
+        return {self.movie_ids[movie] for movie in movies}
+
+    def movie_cast(self, movie_id):
+        """Return set of ids of actors who play in movie_id"""
+        self._index_movies()
+        movie = self.movie_index.get(movie_id)
+        if movie is None:
+            return set()
+        cast = self.cast[self.cast_offsets[movie]:self.cast_offsets[movie+1]]
+        return {self.ids[i] for i in cast}
+
+    def path_movies(self, path):
+        """Return list of movie ids, one connecting every two adjacent actors of path"""
+        self._index_movies()
+        movies = []
+        for actor_id_1, actor_id_2 in zip(path, path[1:]):
+            e = self._edge(actor_id_1, actor_id_2)
+            movies.append(self.movie_ids[self.movies[self.movie_offsets[e]]])
+        return movies
+
+    def layer(self, actor_id, n):
+        """Return set of actor ids at distance n from actor_id"""
+        if n == 0:
+            return {actor_id}
+        start = self.index.get(actor_id)
+        if start is None:
+            return set()
+        _, order, ends = self.tree(start)
+        if n + 1 >= len(ends):
+            return set()
+        return {self.ids[i] for i in order[ends[n]:ends[n+1]]}
+
+    def tree(self, start):
+        """
+        Return BFS tree from actor number start as (parents, order, ends)
+
+        parents[j] is number of actor before actor j on a shortest path
+        from start, -1 if j is not reachable. order lists reachable actors
+        by distance, actors at distance k are order[ends[k]:ends[k+1]].
+        """
+        tree = self.trees.pop(start, None)
+        if tree is None and CACHE_DIR is not None:
+            tree = self._load_tree(start)
+        if tree is None:
+            tree = self._search(start)
+            if CACHE_DIR is not None:
+                self._save_tree(start, tree)
+        self.trees[start] = tree
+        while len(self.trees) > TREE_CACHE_SIZE:
+            del self.trees[next(iter(self.trees))]
+        return tree
+
+    def _search(self, start):
+        """Compute BFS tree from actor number start"""
+        targets, offsets = self.targets, self.offsets
+        parents = array('i', [-1]) * len(self.ids)
+        parents[start] = start
+        order = array('i', [start])
+        ends = array('q', [0, 1])
+        while ends[-2] < ends[-1]:
+            for i in order[ends[-2]:ends[-1]]:
+                for j in targets[offsets[i]:offsets[i+1]]:
+                    if parents[j] < 0:
+                        parents[j] = i
+                        order.append(j)
+            ends.append(len(order))
+        # drop end of the empty last layer
+        return parents, order, ends[:-1]
+
+    def digest(self):
+        """Return hash of data, which names cached trees of the data"""
+        if self._digest is None:
+            text = json.dumps(self.data, separators=(',', ':'))
+            self._digest = hashlib.sha1(text.encode()).hexdigest()
+        return self._digest
+
+    def _tree_file(self, start):
+        return os.path.join(CACHE_DIR, '%s-%d.bfs' % (self.digest(), self.ids[start]))
+
+    def _load_tree(self, start):
+        """Load BFS tree from CACHE_DIR, return None if it is not there"""
+        try:
+            with open(self._tree_file(start), 'rb') as f:
+                sizes = array('q')
+                sizes.fromfile(f, 3)
+                tree = array('i'), array('i'), array('q')
+                for part, size in zip(tree, sizes):
+                    part.fromfile(f, size)
+        except (OSError, EOFError):
+            return None
+        if len(tree[0]) != len(self.ids):
+            return None
+        return tree
+
+    def _save_tree(self, start, tree):
+        """Save BFS tree to CACHE_DIR"""
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        fname = self._tree_file(start)
+        with open(fname + '.tmp', 'wb') as f:
+            array('q', [len(part) for part in tree]).tofile(f)
+            for part in tree:
+                part.tofile(f)
+        # other processes never see half written file
+        os.replace(fname + '.tmp', fname)
+
+    def path(self, actor_id_1, actor_id_2):
+        """
+        Create a list of actor ids of shortest path from actor_id_1 to actor_id_2
+
+        Searches from both ends, expanding the smaller fringe by a whole
+        layer at a time. The first actor reached from both ends is on a
+        shortest path, because before that layer no path of length of the
+        explored layers together existed.
+        """
+        if actor_id_1 == actor_id_2:
+            return [actor_id_1]
+        start = self.index.get(actor_id_1)
+        goal = self.index.get(actor_id_2)
+        if start is None or goal is None:
+            return None
+        # paths from actors with kept trees are looked up
+        for source, target in ((start, goal), (goal, start)):
+            if source in self.trees:
+                path = self._unwind(self.tree(source)[0], source, target)
+                if path is not None and source == goal:
+                    path.reverse()
+                return path
+        targets, offsets = self.targets, self.offsets
+        # {actor number: number of actor one step closer to start or goal}
+        forward = {start: start}
+        backward = {goal: goal}
+        fringe_forward = [start]
+        fringe_backward = [goal]
+        while fringe_forward and fringe_backward:
+            if len(fringe_forward) <= len(fringe_backward):
+                fringe, parents, others = fringe_forward, forward, backward
+            else:
+                fringe, parents, others = fringe_backward, backward, forward
+            add_fringe = []
+            for i in fringe:
+                for j in targets[offsets[i]:offsets[i+1]]:
+                    if j not in parents:
+                        parents[j] = i
+                        if j in others:
+                            return self._join(forward, backward, j)
+                        add_fringe.append(j)
+            if parents is forward:
+                fringe_forward = add_fringe
+            else:
+                fringe_backward = add_fringe
+        return None
+
+    def _unwind(self, parents, start, goal):
+        """Return list of actor ids from start to goal by BFS tree parents"""
+        if parents[goal] < 0:
+            return None
+        path = [goal]
+        while path[-1] != start:
+            path.append(parents[path[-1]])
+        return [self.ids[i] for i in reversed(path)]
+
+    def _join(self, forward, backward, meet):
+        """Return list of actor ids of path through meet by parents from both ends"""
+        path = [meet]
+        while forward[path[-1]] != path[-1]:
+            path.append(forward[path[-1]])
+        path.reverse()
+        while backward[path[-1]] != path[-1]:
+            path.append(backward[path[-1]])
+        return [self.ids[i] for i in path]
+
+
+def get_movie_path(data, actor_id_1, actor_id_2):
+    """Create a list of movie ids connecting actors of path from actor_id_1 to actor_id_2"""
+    path = get_path(data, actor_id_1, actor_id_2)
+    if path is None:
+        return None
+    return get_actor_graph(data).path_movies(path)
+
+
+def get_movie_cast(data, movie_id):
+    """Return set of ids of actors who play in movie_id"""
+    return get_actor_graph(data).movie_cast(movie_id)
 
 
 def get_actors_graph(data):
@@ -56,29 +463,16 @@ def get_actors_graph(data):
 
 def get_bacon_path(data, actor_id):
     """Create a list of actor ids detailing a Bacon path to actor_id"""
-    return get_path(data, BACON_NUMBER, actor_id)
+    graph = get_actor_graph(data)
+    # all Bacon paths are looked up in one BFS tree
+    if BACON_NUMBER in graph.index:
+        graph.tree(graph.index[BACON_NUMBER])
+    return graph.path(BACON_NUMBER, actor_id)
 
 
 def get_path(data, actor_id_1, actor_id_2):
     """Create a list of actor ids detailing a path from actor_id_1 to actor_id_2"""
-    id_graph = get_actors_graph(data)
-    closed = set()
-    add_fringe = set()
-    # in fringe (id, path)
-    fringe = {(actor_id_1, (actor_id_1,))}
-    while not (len(fringe) == 0 and len(add_fringe) == 0):
-        if len(fringe) == 0:
-            fringe = add_fringe
-            add_fringe = set()
-        other_id, path = fringe.pop()
-        if other_id == actor_id_2:
-            return list(path)
-        if other_id not in closed:
-            closed.add(other_id)
-            for new_id in id_graph[other_id]:
-                new_path = path + (new_id,)
-                add_fringe.add((new_id, new_path))
-    return None
+    return get_actor_graph(data).path(actor_id_1, actor_id_2)
 
 
 if __name__ == '__main__':
@@ -107,20 +501,19 @@ if __name__ == '__main__':
     db = {'small': smalldb, 'large': largedb}
     for namedb, bacon_number in data:
         print(f'Set of actors with Bacon number {bacon_number} in the {namedb}.json:')
-        print(', '.join(get_actor_name(names, actor_id)
-            for actor_id in get_actors_with_bacon_number(db[namedb], bacon_number)))
+        print(', '.join(get_actor_names(
+            names, get_actors_with_bacon_number(db[namedb], bacon_number))))
     print()
     print('Bacon Path')
     for actor in ('Karen Allen', 'Si Jenks', 'Iva Ilakovac'):
         print(f'Path of actors from Kevin Vacon to {actor} in large.json:')
-        print(', '.join(get_actor_name(names, actor_id)
-            for actor_id in get_bacon_path(largedb, get_actor_id(names, actor))))
+        print(', '.join(get_actor_names(
+            names, get_bacon_path(largedb, get_actor_id(names, actor)))))
     print()
     print('Arbitrary Path')
     for actor_1, actor_2 in (('Richard Pierson', 'Anton Radacic'),
                                    ('Lam Yi-Wa', 'Emily Longstreth')):
         print(f'Path of actors from {actor_1} to {actor_2} in large.json:')
-        print(', '.join(get_actor_name(names, actor_id)
-            for actor_id in get_path(largedb,
-                                     get_actor_id(names, actor_1),
-                                     get_actor_id(names, actor_2))))
+        print(', '.join(get_actor_names(
+            names, get_path(largedb, get_actor_id(names, actor_1),
+                            get_actor_id(names, actor_2)))))
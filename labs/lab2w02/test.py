@@ -2,6 +2,7 @@
 import os
 import lab
 import json
+import tempfile
 import unittest
 
 TEST_DIRECTORY = os.path.dirname(__file__)
@@ -248,6 +249,178 @@ class TestBaconPath(unittest.TestCase):
         self.assertEqual(result, expected)
 
 
+class TestActorGraph(unittest.TestCase):
+    def setUp(self):
+        """ Load actor/movie database """
+        with open('resources/small.json', 'r') as f:
+            self.db_small = json.load(f)
+
+    def test_memoized(self):
+        # graph is built once for the same data
+        graph = lab.get_actor_graph(self.db_small)
+        self.assertIs(lab.get_actor_graph(self.db_small), graph)
+        lab.get_bacon_path(self.db_small, 46866)
+        lab.get_actors_with_bacon_number(self.db_small, 3)
+        self.assertIs(lab.get_actor_graph(self.db_small), graph)
+        # equal data in other object has its own graph
+        other = [list(row) for row in self.db_small]
+        self.assertIsNot(lab.get_actor_graph(other), graph)
+        self.assertEqual(lab.get_actor_graph(other).neighbors(4724),
+                         graph.neighbors(4724))
+        # added movies are seen
+        other.append([4724, 2876669, 0])
+        self.assertEqual(lab.get_bacon_path(other, 2876669), [4724, 2876669])
+
+    def test_neighbors(self):
+        # compact graph has the same neighbors as dict of sets
+        graph = lab.get_actor_graph(self.db_small)
+        expected = lab.get_actors_graph(self.db_small)
+        self.assertEqual(len(graph.ids), len(expected))
+        for actor_id, neighbors in expected.items():
+            self.assertEqual(graph.neighbors(actor_id), neighbors)
+        self.assertEqual(graph.neighbors(2876669), set())
+
+    def test_path_lengths(self):
+        # path to every actor with Bacon number n has n movies
+        for n in range(6):
+            for actor_id in lab.get_actors_with_bacon_number(self.db_small, n):
+                with self.subTest(n=n, actor_id=actor_id):
+                    for path in (lab.get_bacon_path(self.db_small, actor_id),
+                                 lab.get_path(self.db_small, actor_id, 4724)):
+                        self.assertEqual(len(path) - 1, n)
+                        self.assertTrue(valid_path(self.db_small, path))
+                    self.assertEqual(path[0], actor_id)
+
+    def test_trees(self):
+        # layers of kept BFS trees are equal to Bacon numbers
+        graph = lab.get_actor_graph(self.db_small)
+        expected = [lab.get_actors_with_bacon_number(self.db_small, n) for n in range(8)]
+        bacon = graph.index[4724]
+        parents, order, ends = graph.tree(bacon)
+        self.assertIn(bacon, graph.trees)
+        self.assertEqual([{graph.ids[i] for i in order[a:b]} for a, b in zip(ends, ends[1:])],
+                         [layer for layer in expected if layer])
+        for i in range(lab.TREE_CACHE_SIZE + 2):
+            graph.tree(i)
+        self.assertEqual(len(graph.trees), lab.TREE_CACHE_SIZE)
+        self.assertNotIn(bacon, graph.trees)
+
+    def test_disk_cache(self):
+        # trees are loaded from cache of the same data
+        data = [list(row) for row in self.db_small]
+        with tempfile.TemporaryDirectory() as tmp:
+            lab.CACHE_DIR = tmp
+            try:
+                expected = lab.get_bacon_path(data, 46866)
+                self.assertEqual(len(os.listdir(tmp)), 1)
+                graph = lab.ActorGraph([list(row) for row in data])
+                graph._search = None
+                self.assertEqual(graph.path(4724, 46866), expected)
+                self.assertEqual(graph.layer(4724, 3), lab.get_actors_with_bacon_number(data, 3))
+                # other data has other trees
+                data.append([4724, 2876669, 0])
+                self.assertEqual(lab.get_bacon_path(data, 2876669), [4724, 2876669])
+                self.assertEqual(len(os.listdir(tmp)), 2)
+            finally:
+                lab.CACHE_DIR = None
+
+    def test_movies(self):
+        # movies of pairs and casts of movies are those of data
+        graph = lab.get_actor_graph(self.db_small)
+        pairs, casts = {}, {}
+        for id_1, id_2, movie in self.db_small:
+            pairs.setdefault(frozenset((id_1, id_2)), set()).add(movie)
+            casts.setdefault(movie, set()).update((id_1, id_2))
+        for pair, movies in pairs.items():
+            id_1, id_2 = tuple(pair) * (3 - len(pair))
+            self.assertTrue(lab.did_x_and_y_act_together(self.db_small, id_1, id_2))
+            self.assertEqual(graph.movies_together(id_1, id_2), movies)
+            self.assertEqual(graph.movies_together(id_2, id_1), movies)
+        for movie, cast in casts.items():
+            self.assertEqual(lab.get_movie_cast(self.db_small, movie), cast)
+        self.assertEqual(graph.movies_together(4724, 16935), set())
+        self.assertEqual(lab.get_movie_cast(self.db_small, -1), set())
+
+    def test_lazy_movies(self):
+        # movie arrays are built on the first movie query only
+        graph = lab.ActorGraph(self.db_small)
+        self.assertEqual(len(graph.path(4724, 46866)), 4)
+        self.assertTrue(graph.acted_together(4724, 9210))
+        self.assertIsNone(graph.movie_index)
+        self.assertEqual(len(graph.path_movies(graph.path(4724, 46866))), 3)
+        self.assertIsNotNone(graph.movie_index)
+        self.assertEqual(graph.movie_cast(-1), set())
+
+    def test_movie_path(self):
+        # every movie of path has both actors of its hop
+        for actor_id in lab.get_actors_with_bacon_number(self.db_small, 3):
+            path = lab.get_bacon_path(self.db_small, actor_id)
+            movies = lab.get_movie_path(self.db_small, 4724, actor_id)
+            self.assertEqual(len(movies), 3)
+            for hop, movie in zip(zip(path, path[1:]), movies):
+                self.assertLessEqual(set(hop), lab.get_movie_cast(self.db_small, movie))
+        self.assertIsNone(lab.get_movie_path(self.db_small, 4724, 2876669))
+
+    def test_cache_size(self):
+        datasets = [[[1, i, 0]] for i in range(2, lab.GRAPH_CACHE_SIZE + 5)]
+        for data in datasets:
+            self.assertEqual(lab.get_path(data, 1, data[0][1]), [1, data[0][1]])
+        self.assertLessEqual(len(lab._graphs), lab.GRAPH_CACHE_SIZE)
+
+
+class TestSnapshot(unittest.TestCase):
+    def test_snapshot(self):
+        # graph is loaded from snapshot until JSON file changes
+        with tempfile.TemporaryDirectory() as tmp:
+            fname = os.path.join(tmp, 'small.json')
+            with open('resources/small.json') as f:
+                data = json.load(f)
+            with open(fname, 'w') as f:
+                json.dump(data, f)
+            built = lab.load_graph(fname)
+            self.assertTrue(os.path.exists(fname + '.graph'))
+            graph = lab.load_graph(fname)
+            self.assertIsNot(graph, built)
+            for name, _ in lab.SNAPSHOT_PARTS:
+                self.assertEqual(getattr(graph, name), getattr(built, name))
+            self.assertEqual(graph.digest(), lab.get_actor_graph(data).digest())
+            # functions take graph in place of data
+            self.assertEqual(lab.get_actors_with_bacon_number(graph, 3),
+                             lab.get_actors_with_bacon_number(data, 3))
+            self.assertEqual(len(lab.get_bacon_path(graph, 46866)), 4)
+            self.assertTrue(lab.did_x_and_y_act_together(graph, 4724, 9210))
+            # changed file is read again
+            data.append([4724, 2876669, 0])
+            with open(fname, 'w') as f:
+                json.dump(data, f)
+            os.utime(fname, ns=(0, 0))
+            self.assertEqual(lab.get_bacon_path(lab.load_graph(fname), 2876669),
+                             [4724, 2876669])
+            # broken snapshot is rebuilt
+            with open(fname + '.graph', 'wb') as f:
+                f.write(b'broken')
+            self.assertEqual(lab.load_graph(fname).ids, lab.get_actor_graph(data).ids)
+
+
+class TestNames(unittest.TestCase):
+    def setUp(self):
+        with open('resources/small_names.json', 'r') as f:
+            self.names = json.load(f)
+
+    def test_names(self):
+        # names are found as by scanning names data
+        ids = list(self.names.values())
+        expected = [next(name for name, other_id in self.names.items() if other_id == actor_id)
+                    for actor_id in ids]
+        self.assertEqual(lab.get_actor_names(self.names, ids), expected)
+        self.assertEqual([lab.get_actor_name(self.names, actor_id) for actor_id in ids], expected)
+        self.assertIs(lab.get_name_index(self.names), lab.get_name_index(self.names))
+        self.assertEqual(lab.get_actor_names(self.names, []), [])
+        # added names are seen
+        self.names['New Actor'] = -1
+        self.assertEqual(lab.get_actor_name(self.names, -1), 'New Actor')
+
+
 def valid_path(d, p):
     x = {frozenset(i[:-1]) for i in d}
     return all(frozenset(i) in x for i in zip(p, p[1:]))
@@ -1,4 +1,4 @@
-import lab, json, traceback, time
+import lab, traceback, time
 from importlib import reload
 reload(lab)  # this forces the student code to be reloaded when page is refreshed
 
@@ -53,9 +53,8 @@ large_data = None
 def init():
     global small_data
     global large_data
-    with open('./resources/small.json', 'r') as f:
-            small_data = json.load(f)
-    with open('./resources/large.json', 'r') as f:
-            large_data = json.load(f)
+    # graphs are loaded from snapshots, rebuilt when JSON files change
+    small_data = lab.load_graph('./resources/small.json')
+    large_data = lab.load_graph('./resources/large.json')
 
 init()